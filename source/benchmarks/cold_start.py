@@ -0,0 +1,107 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+"""
+Measures the import (INIT phase) time of every Lambda handler in a fresh interpreter.
+
+Each handler module is imported in a new Python process with the function directory and
+the shared layer on the path, the way the Lambda runtime loads it, and the wall clock time
+of `import app` is recorded. Run it from an environment that has the function
+requirements and the Powertools package installed:
+
+    python source/benchmarks/cold_start.py --runs 10 --output cold_start.json
+    python source/benchmarks/cold_start.py --runs 10 --baseline cold_start.json
+
+With --baseline the report shows the change against an earlier result so import time
+regressions show up next to the savings.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+SOURCE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SHARED_DIR = os.path.join(SOURCE_DIR, "shared")
+
+# Values the handlers read at import time or that Powertools expects; none of them is used
+# to make a network call during the import.
+FUNCTION_ENVIRONMENT = {
+    "AWS_REGION": "us-east-1",
+    "AWS_DEFAULT_REGION": "us-east-1",
+    "POWERTOOLS_SERVICE_NAME": "ColdStartBenchmark",
+    "POWERTOOLS_METRICS_NAMESPACE": "MultiRegionBatchBenchmark",
+    "POWERTOOLS_TRACE_DISABLED": "true",
+    "LOG_LEVEL": "INFO",
+}
+
+_IMPORT_SNIPPET = (
+    "import time\n"
+    "start = time.perf_counter()\n"
+    "import app\n"
+    "print(time.perf_counter() - start)\n"
+)
+
+
+def function_dirs():
+    for name in sorted(os.listdir(SOURCE_DIR)):
+        path = os.path.join(SOURCE_DIR, name)
+        if os.path.isfile(os.path.join(path, "app.py")):
+            yield name, path
+
+
+def measure(function_dir, runs):
+    env = dict(os.environ, **FUNCTION_ENVIRONMENT)
+    env["PYTHONPATH"] = os.pathsep.join([function_dir, SHARED_DIR])
+    env["PYTHONDONTWRITEBYTECODE"] = "1"
+    samples = []
+    for _ in range(runs):
+        result = subprocess.run([sys.executable, "-c", _IMPORT_SNIPPET], cwd=function_dir, env=env,
+                                capture_output=True, text=True)
+        if result.returncode != 0:
+            return {"error": result.stderr.strip().splitlines()[-1]}
+        samples.append(float(result.stdout.strip().splitlines()[-1]) * 1000)
+    samples.sort()
+    return {
+        "runs": runs,
+        "p50_ms": statistics.median(samples),
+        "p90_ms": samples[min(len(samples) - 1, int(len(samples) * 0.9))],
+        "min_ms": samples[0],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="fresh interpreters per function")
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    parser.add_argument("--baseline", help="JSON file from an earlier run to compare against")
+    parser.add_argument("functions", nargs="*", help="function directories to measure (default: all)")
+    args = parser.parse_args()
+
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+
+    results = {}
+    print("%-26s %10s %10s %10s %12s" % ("function", "p50 ms", "p90 ms", "min ms", "vs baseline"))
+    for name, path in function_dirs():
+        if args.functions and name not in args.functions:
+            continue
+        result = measure(path, args.runs)
+        results[name] = result
+        if "error" in result:
+            print("%-26s failed to import: %s" % (name, result["error"]))
+            continue
+        delta = ""
+        if "p50_ms" in baseline.get(name, {}):
+            delta = "%+.1f%%" % ((result["p50_ms"] / baseline[name]["p50_ms"] - 1) * 100)
+        print("%-26s %10.1f %10.1f %10.1f %12s" % (name, result["p50_ms"], result["p90_ms"], result["min_ms"], delta))
+
+    if args.output:
+        with open(args.output, "w") as output_file:
+            json.dump(results, output_file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,385 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+"""
+Measures the time from a regional fault until the standby region processes its first file.
+
+The failover function (`get_current_routing_control_state` and `rotate_arc_controls`, as
+the failover runbook runs them) talks to local stand-ins for the Route 53 ARC cluster
+endpoints through a real botocore client, so the ARC_ENDPOINT_TIMEOUT and retry settings
+apply as in Lambda. The primary region detection of the S3 notification function
+(`resolve_primary_region`) queries a local DNS server whose TXT answer follows the routing
+control. Each trial:
+
+  1. injects the fault of the scenario into the first cluster endpoints (the endpoints of
+     the failed region come first, as nothing orders ARC_CLUSTER_ENDPOINTS by health),
+  2. runs the failover function after --detection-delay seconds,
+  3. lets the DNS stand-in keep answering the old region for up to --dns-ttl seconds after
+     the routing control changed, like a resolver cache filled at a random time,
+  4. invokes the primary region detection of the standby region for a file arriving every
+     --event-interval seconds until it answers with the standby region.
+
+The time until step 4 succeeds is reported in percentiles, with the failover function and
+DNS part of it. Starting the execution for the file is left out, as it costs the same
+before and after a failover. Run it from an environment with the failover and notification
+function requirements installed, with time values scaled down to keep runs short:
+
+    python source/benchmarks/failover_recovery.py --trials 20 --output failover.json
+    python source/benchmarks/failover_recovery.py --trials 20 --arc-timeout 1 --baseline failover.json
+"""
+import argparse
+import importlib.util
+import json
+import math
+import os
+import random
+import socket
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+SOURCE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SHARED_DIR = os.path.join(SOURCE_DIR, "shared")
+
+PRIMARY_REGION = "us-east-1"
+STANDBY_REGION = "us-west-2"
+ENDPOINT_REGIONS = ["us-east-1", "us-west-2", "eu-west-1", "ap-northeast-1", "ap-southeast-2"]
+ROUTING_CONTROL_ARN = "arn:aws:route53-recovery-control::111122223333:controlpanel/benchmark/routingcontrol/primary"
+DOMAIN_NAME = "primary.batch.benchmark."
+
+# Behaviour of the first endpoints in each scenario; the remaining endpoints are healthy.
+SCENARIOS = {
+    "healthy": [],
+    "slow": ["slow"],
+    "erroring": ["error"],
+    "hanging": ["hang"],
+    "refused": ["refused"],
+    "degraded": ["hang", "error", "slow"],
+}
+
+# Credentials and settings for the function modules; the stand-ins do not check signatures.
+FUNCTION_ENVIRONMENT = {
+    "AWS_REGION": STANDBY_REGION,
+    "AWS_DEFAULT_REGION": STANDBY_REGION,
+    "AWS_ACCESS_KEY_ID": "benchmark",
+    "AWS_SECRET_ACCESS_KEY": "benchmark",
+    "AWS_SESSION_TOKEN": "benchmark",
+    "POWERTOOLS_SERVICE_NAME": "FailoverBenchmark",
+    "POWERTOOLS_METRICS_NAMESPACE": "MultiRegionBatchBenchmark",
+    "POWERTOOLS_TRACE_DISABLED": "true",
+}
+
+
+class RoutingControl:
+    """
+    The routing control state held by the cluster. "On" routes to the primary region.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.state = "On"
+            self.changed_at = None
+
+    def get(self):
+        with self._lock:
+            return self.state
+
+    def update(self, state):
+        with self._lock:
+            if state != self.state:
+                self.state = state
+                self.changed_at = time.perf_counter()
+
+
+class _ClusterHandler(BaseHTTPRequestHandler):
+    # The route53-recovery-cluster API uses the JSON 1.0 protocol: a POST to / with the
+    # operation in X-Amz-Target.
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        behaviour = self.server.behaviour
+        if behaviour == "hang":
+            self.server.stopped.wait(300)
+            return
+        if behaviour == "slow":
+            time.sleep(self.server.slow_seconds)
+        if behaviour == "error":
+            self._reply(500, {"__type": "InternalServerException", "message": "Injected fault"})
+            return
+        operation = self.headers.get("X-Amz-Target", "").split(".")[-1]
+        if operation == "GetRoutingControlState":
+            self._reply(200, {"RoutingControlArn": body.get("RoutingControlArn"),
+                              "RoutingControlState": self.server.control.get()})
+        elif operation == "UpdateRoutingControlState":
+            self.server.control.update(body["RoutingControlState"])
+            self._reply(200, {})
+        else:
+            self._reply(400, {"__type": "ValidationException", "message": "Unknown operation " + operation})
+
+    def _reply(self, status, payload):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/x-amz-json-1.0")
+        self.send_header("Content-Length", str(len(data)))
+        try:
+            self.end_headers()
+            self.wfile.write(data)
+        except (BrokenPipeError, ConnectionResetError):
+            # The client timed out before the slow answer was ready.
+            pass
+
+    def log_message(self, format, *args):
+        pass
+
+
+class ClusterEndpoint:
+    """
+    One ARC cluster endpoint on a local port, with an injectable fault: "slow" answers
+    after --slow-seconds, "hang" never answers, "error" answers with HTTP 500 and "refused"
+    closes the port.
+    """
+
+    def __init__(self, control, slow_seconds):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), _ClusterHandler)
+        self.server.daemon_threads = True
+        self.server.control = control
+        self.server.slow_seconds = slow_seconds
+        self.server.behaviour = "ok"
+        self.server.stopped = threading.Event()
+        self.port = self.server.server_address[1]
+        self.url = "http://127.0.0.1:%d" % self.port
+        self._refused = None
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def inject(self, behaviour):
+        self.server.behaviour = behaviour
+        if behaviour == "refused" and self._refused is None:
+            # A port with nothing listening, so the connection is refused right away.
+            probe = socket.socket()
+            probe.bind(("127.0.0.1", 0))
+            self._refused = "http://127.0.0.1:%d" % probe.getsockname()[1]
+            probe.close()
+
+    def endpoint_url(self):
+        return self._refused if self.server.behaviour == "refused" else self.url
+
+    def close(self):
+        self.server.stopped.set()
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class DnsStandIn:
+    """
+    A DNS server on a local UDP port answering TXT queries for DOMAIN_NAME with the region
+    the routing control points to. After the control changes, the previous answer is served
+    for a random part of `ttl`, like a recursive resolver whose cache entry has that much
+    time left. `loss` is the share of queries dropped without an answer.
+    """
+
+    def __init__(self, control, ttl, loss):
+        import dns.message
+        import dns.rrset
+
+        self._message = dns.message
+        self._rrset = dns.rrset
+        self.control = control
+        self.ttl = ttl
+        self.loss = loss
+        self.queries = 0
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.socket.bind(("127.0.0.1", 0))
+        self.port = self.socket.getsockname()[1]
+        self.reset()
+        threading.Thread(target=self._serve, daemon=True).start()
+
+    def reset(self):
+        self.cache_left = random.uniform(0, self.ttl)
+
+    def answer(self):
+        state = self.control.get()
+        changed_at = self.control.changed_at
+        if changed_at is not None and time.perf_counter() - changed_at < self.cache_left:
+            state = "Off" if state == "On" else "On"
+        return PRIMARY_REGION if state == "On" else STANDBY_REGION
+
+    def _serve(self):
+        while True:
+            try:
+                wire, address = self.socket.recvfrom(4096)
+            except OSError:
+                return
+            self.queries += 1
+            if random.random() < self.loss:
+                continue
+            query = self._message.from_wire(wire)
+            response = self._message.make_response(query)
+            question = query.question[0]
+            if question.name.to_text() == DOMAIN_NAME:
+                response.answer.append(self._rrset.from_text(question.name, max(1, int(self.ttl)), "IN", "TXT",
+                                                             '"%s"' % self.answer()))
+            self.socket.sendto(response.to_wire(), address)
+
+    def use_as_default_resolver(self, timeout):
+        import dns.resolver
+
+        resolver = dns.resolver.Resolver(configure=False)
+        resolver.nameservers = ["127.0.0.1"]
+        resolver.port = self.port
+        resolver.timeout = timeout
+        resolver.lifetime = timeout * 2
+        dns.resolver.default_resolver = resolver
+
+    def close(self):
+        self.socket.close()
+
+
+def load_function(name, module_name):
+    path = os.path.join(SOURCE_DIR, name, "app.py")
+    spec = importlib.util.spec_from_file_location(module_name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def percentile(samples, fraction):
+    return samples[min(len(samples) - 1, int(len(samples) * fraction))]
+
+
+def summarize(samples):
+    samples = sorted(samples)
+    if not samples:
+        return None
+    return {"p50_s": percentile(samples, 0.5), "p90_s": percentile(samples, 0.9),
+            "p99_s": percentile(samples, 0.99), "max_s": samples[-1]}
+
+
+def run_trial(failover, notification, control, endpoints, dns_stand_in, faults, args):
+    control.reset()
+    dns_stand_in.reset()
+    for endpoint, behaviour in zip(endpoints, faults + ["ok"] * len(endpoints)):
+        endpoint.inject(behaviour)
+    os.environ["ARC_CLUSTER_ENDPOINTS"] = json.dumps(
+        {region: endpoint.endpoint_url() for region, endpoint in zip(ENDPOINT_REGIONS, endpoints)})
+    # Files keep arriving in the standby region at a fixed rate from some point before the fault.
+    first_event = random.uniform(0, args.event_interval)
+
+    fault_at = time.perf_counter()
+    time.sleep(args.detection_delay)
+    event = {"FUNCTION": "get_current_routing_control_state"}
+    failover.get_current_routing_control_state(event, None)
+    event = {"FUNCTION": "rotate_arc_controls"}
+    rotated = failover.rotate_arc_controls(event, None)
+    failover.metrics.clear_metrics()
+    rotated_at = time.perf_counter()
+    if rotated["routing_control_state"] == "NotUpdated":
+        return {"recovered": False, "arc_s": rotated_at - fault_at}
+
+    deadline = rotated_at + args.dns_ttl + args.event_interval + args.max_wait
+    events = 0
+    while time.perf_counter() < deadline:
+        elapsed = time.perf_counter() - fault_at
+        next_event = first_event + max(0, math.ceil((elapsed - first_event) / args.event_interval)) * args.event_interval
+        time.sleep(max(0, next_event - elapsed))
+        events += 1
+        try:
+            region = notification.resolve_primary_region(DOMAIN_NAME)
+        except Exception:
+            # The notification invocation fails and the file's event is retried later.
+            continue
+        if region == STANDBY_REGION:
+            recovered_at = time.perf_counter()
+            return {"recovered": True, "arc_s": rotated_at - fault_at, "dns_s": recovered_at - rotated_at,
+                    "total_s": recovered_at - fault_at, "events": events}
+    return {"recovered": False, "arc_s": rotated_at - fault_at}
+
+
+def run_scenario(failover, notification, control, endpoints, dns_stand_in, faults, args):
+    trials = [run_trial(failover, notification, control, endpoints, dns_stand_in, faults, args)
+              for _ in range(args.trials)]
+    recovered = [trial for trial in trials if trial["recovered"]]
+    return {
+        "trials": len(trials),
+        "recovered": len(recovered),
+        "failover_function": summarize([trial["arc_s"] for trial in trials]),
+        "dns": summarize([trial["dns_s"] for trial in recovered]),
+        "time_to_recover": summarize([trial["total_s"] for trial in recovered]),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--trials", type=int, default=10, help="failovers per scenario")
+    parser.add_argument("--arc-timeout", type=float, default=float(os.environ.get("ARC_ENDPOINT_TIMEOUT", 2)),
+                        help="ARC_ENDPOINT_TIMEOUT of the failover function in seconds")
+    parser.add_argument("--slow-seconds", type=float, default=1.0, help="response delay of a slow endpoint")
+    parser.add_argument("--dns-ttl", type=float, default=5.0,
+                        help="longest time the old region is still answered after the switch")
+    parser.add_argument("--dns-loss", type=float, default=0.0, help="share of DNS queries left unanswered")
+    parser.add_argument("--dns-timeout", type=float, default=2.0, help="resolver timeout per query in seconds")
+    parser.add_argument("--event-interval", type=float, default=1.0, help="seconds between files in the standby region")
+    parser.add_argument("--detection-delay", type=float, default=0.0, help="seconds from the fault to the failover")
+    parser.add_argument("--max-wait", type=float, default=60.0, help="seconds to wait for recovery beyond the DNS TTL")
+    parser.add_argument("--verbose", action="store_true", help="show the function logs")
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    parser.add_argument("--baseline", help="JSON file from an earlier run to compare against")
+    parser.add_argument("scenarios", nargs="*", help="scenarios to run, of %s (default: all)" % ", ".join(SCENARIOS))
+    args = parser.parse_args()
+    unknown = [name for name in args.scenarios if name not in SCENARIOS]
+    if unknown:
+        parser.error("unknown scenarios: " + ", ".join(unknown))
+
+    os.environ.update(FUNCTION_ENVIRONMENT)
+    os.environ["ARC_ENDPOINT_TIMEOUT"] = str(args.arc_timeout)
+    os.environ["ARC_ROUTING_CONTROL_ARN"] = ROUTING_CONTROL_ARN
+    os.environ["LOG_LEVEL"] = "INFO" if args.verbose else "CRITICAL"
+    sys.path.insert(0, SHARED_DIR)
+    failover = load_function("failover", "failover_app")
+    notification = load_function("s3-lambda-notification", "notification_app")
+
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)["scenarios"]
+
+    control = RoutingControl()
+    endpoints = [ClusterEndpoint(control, args.slow_seconds) for _ in ENDPOINT_REGIONS]
+    dns_stand_in = DnsStandIn(control, args.dns_ttl, args.dns_loss)
+    dns_stand_in.use_as_default_resolver(args.dns_timeout)
+
+    results = {}
+    print("%-10s %9s %12s %10s %10s %10s %10s %12s" % ("scenario", "recovered", "failover p50", "dns p50",
+                                                     "p50 s", "p90 s", "p99 s", "vs baseline"))
+    try:
+        for name in args.scenarios or SCENARIOS:
+            result = run_scenario(failover, notification, control, endpoints, dns_stand_in, SCENARIOS[name], args)
+            results[name] = result
+            recovered = "%d/%d" % (result["recovered"], result["trials"])
+            if result["time_to_recover"] is None:
+                print("%-10s %9s %12.2f %10s" % (name, recovered, result["failover_function"]["p50_s"], "-"))
+                continue
+            total = result["time_to_recover"]
+            delta = ""
+            if (baseline.get(name) or {}).get("time_to_recover"):
+                delta = "%+.1f%%" % ((total["p50_s"] / baseline[name]["time_to_recover"]["p50_s"] - 1) * 100)
+            print("%-10s %9s %12.2f %10.2f %10.2f %10.2f %10.2f %12s" % (
+                name, recovered, result["failover_function"]["p50_s"], result["dns"]["p50_s"],
+                total["p50_s"], total["p90_s"], total["p99_s"], delta))
+    finally:
+        for endpoint in endpoints:
+            endpoint.close()
+        dns_stand_in.close()
+
+    if args.output:
+        with open(args.output, "w") as output_file:
+            json.dump({"settings": {name: value for name, value in vars(args).items()
+                                    if name not in ("output", "baseline", "scenarios", "verbose")},
+                       "scenarios": results}, output_file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
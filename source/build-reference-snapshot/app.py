@@ -0,0 +1,36 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+import os
+
+from aws_lambda_powertools import Logger, Tracer, Metrics
+from aws_lambda_powertools.metrics import MetricUnit
+
+import existence_index
+import snapshot
+
+metrics = Metrics()
+tracer = Tracer()
+logger = Logger()
+
+
+@metrics.log_metrics(capture_cold_start_metric=False)
+@logger.inject_lambda_context(clear_state=True)
+@tracer.capture_lambda_handler
+def lambda_handler(event, context):
+    """
+    Rebuilds the reference snapshot and the existence index from the financial table on a
+    schedule, so enrichment can keep using them after the table changed.
+    """
+    table_name = os.environ['FINANCIAL_TABLE_NAME']
+    items = snapshot.scan_table(table_name)
+    index = snapshot.SnapshotIndex.from_rows(items)
+    manifest = snapshot.write_snapshot(os.environ['SNAPSHOT_BUCKET'], index, source=table_name)
+    metrics.add_metric(name="SnapshotRows", unit=MetricUnit.Count, value=manifest['rows'])
+    metrics.add_metric(name="SnapshotBytes", unit=MetricUnit.Bytes, value=manifest['bytes'])
+    logger.info({"Reference snapshot": manifest})
+    manifest['existenceIndex'] = existence_index.write_index(os.environ['SNAPSHOT_BUCKET'],
+                                                             [item[index.key_name] for item in items],
+                                                             source=table_name)
+    metrics.add_metric(name="ExistenceIndexBytes", unit=MetricUnit.Bytes, value=manifest['existenceIndex']['bytes'])
+    logger.info({"Existence index": manifest['existenceIndex']})
+    return manifest
@@ -0,0 +1,38 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+from aws_lambda_powertools import Logger, Tracer, Metrics
+from aws_lambda_powertools.metrics import MetricUnit
+
+import governor
+import s3_stream
+
+metrics = Metrics()
+tracer = Tracer()
+logger = Logger()
+
+
+@metrics.log_metrics(capture_cold_start_metric=False)
+@logger.inject_lambda_context(clear_state=True)
+@tracer.capture_lambda_handler
+def lambda_handler(event, context):
+    """
+    Takes ("acquire") or gives back ("release") the slot of a chunk workflow. An acquire
+    that has to wait raises SlotUnavailable, which the state machine retries.
+    """
+    lease_id = event['LeaseId']
+    if event['action'] == 'release':
+        governor.default_governor().release(lease_id)
+        return {"released": True}
+
+    # The first folder of a part key is the file id; the slots are shared between files.
+    file_id = s3_stream.split_path(event['FilePath'])[1].split("/")[0]
+    weight = int(event.get('Weight') or 1)
+    granted, status = governor.default_governor().acquire(lease_id, file_id, weight)
+    metrics.add_metric(name="GovernorInFlight", unit=MetricUnit.Count, value=status['inFlight'])
+    metrics.add_metric(name="GovernorQueueDepth", unit=MetricUnit.Count, value=status['queueDepth'])
+    if not granted:
+        metrics.add_metric(name="GovernorWaits", unit=MetricUnit.Count, value=1)
+        logger.info({"Waiting for a chunk slot": lease_id, "file": file_id, **status})
+        raise governor.SlotUnavailable("No chunk slot for %s: %d in flight, %d waiting"
+                                       % (lease_id, status['inFlight'], status['queueDepth']))
+    return {"acquired": True, **status}
@@ -0,0 +1,82 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+import json
+import os
+
+from aws_lambda_powertools import Logger, Tracer, Metrics
+from aws_lambda_powertools.metrics import MetricUnit
+
+import clients
+
+metrics = Metrics()
+tracer = Tracer()
+logger = Logger()
+
+
+def group_files(messages, max_bytes, max_files):
+    """
+    Groups the queued files into batches of at most max_bytes of input and max_files files,
+    keeping the order in which they were queued. A file larger than max_bytes gets a batch
+    of its own.
+    """
+    batches = []
+    current = []
+    current_bytes = 0
+    for message_id, param in messages:
+        size = param['size']
+        if current and (current_bytes + size > max_bytes or len(current) >= max_files):
+            batches.append(current)
+            current = []
+            current_bytes = 0
+        current.append((message_id, param))
+        current_bytes += size
+    if current:
+        batches.append(current)
+    return batches
+
+
+def small_file(param):
+    # Only what the small-file workflow needs, so a batch of files stays well below the
+    # Step Functions input limit.
+    record = param['Records']
+    return {
+        "bucket": record['s3']['bucket']['name'],
+        "key": record['s3']['object']['key'],
+        "size": record['s3']['object'].get('size', 0),
+        "fileId": param['fileId']
+    }
+
+
+@metrics.log_metrics(capture_cold_start_metric=False)
+@logger.inject_lambda_context(clear_state=True)
+@tracer.capture_lambda_handler
+def lambda_handler(event, context):
+    max_bytes = int(os.environ.get('SMALL_FILE_BATCH_MAX_BYTES', 50 * 1024 * 1024))
+    max_files = int(os.environ.get('SMALL_FILE_BATCH_MAX_FILES', 100))
+    messages = []
+    for message in event['Records']:
+        param = json.loads(message['body'])
+        messages.append((message['messageId'], dict(small_file(param),
+                                                    inputArchiveFolder=param['inputArchiveFolder'],
+                                                    fileDelimiter=param['fileDelimiter'])))
+
+    failures = []
+    batches = group_files(messages, max_bytes, max_files)
+    for index, batch in enumerate(batches):
+        files = [param for _, param in batch]
+        try:
+            clients.client('stepfunctions').start_execution(
+                stateMachineArn=os.environ['SMALL_FILES_STATE_MACHINE_ARN'],
+                name="%s-%d" % (context.aws_request_id, index),
+                input=json.dumps({"files": files})
+            )
+            logger.info({"Small file batch": index, "files": [f['key'] for f in files],
+                         "bytes": sum(f['size'] for f in files)})
+        except Exception:
+            # Only the messages of this batch go back to the queue; the others were started.
+            logger.exception({"Small file batch error": [f['key'] for f in files]})
+            failures.extend({"itemIdentifier": message_id} for message_id, _ in batch)
+
+    metrics.add_metric(name="SmallFilesCoalesced", unit=MetricUnit.Count, value=len(messages) - len(failures))
+    metrics.add_metric(name="SmallFileBatches", unit=MetricUnit.Count, value=len(batches))
+    return {"batchItemFailures": failures}
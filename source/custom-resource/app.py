@@ -3,13 +3,10 @@
 import csv
 import json
 
-import boto3
 from aws_lambda_powertools import Logger, Tracer, Metrics
 
 import cfnresponse
-
-s3Client = boto3.client('s3')
-dynamodb = boto3.resource('dynamodb')
+import clients
 
 metrics = Metrics()
 tracer = Tracer()
@@ -43,7 +40,7 @@ def lambda_handler(event, context):
 
 @tracer.capture_method
 def add_bucket_notification(bucket_name, notification_id, function_arn):
-    notification_response = s3Client.put_bucket_notification_configuration(
+    notification_response = clients.client('s3').put_bucket_notification_configuration(
         Bucket=bucket_name,
         NotificationConfiguration={
             'LambdaFunctionConfigurations': [
@@ -74,21 +71,26 @@ def add_bucket_notification(bucket_name, notification_id, function_arn):
     return notification_response
 
 
-def load_csv_data(table_name):
+def load_csv_data(table_name, bucket_name=None):
     csv_file = "testfile_financial_data.csv"
 
     batch_size = 100
     batch = []
+    rows = []
 
     for row in csv.DictReader(open(csv_file)):
         if len(batch) >= batch_size:
             write_to_dynamo(batch, table_name)
             batch.clear()
         batch.append(row)
+        rows.append(row)
 
     if batch:
         write_to_dynamo(batch, table_name)
 
+    if bucket_name:
+        write_snapshot(rows, bucket_name, table_name)
+
     return {
         'statusCode': 200,
         'body': json.dumps('CSV file loaded into the DYnamoDB table')
@@ -98,7 +100,7 @@ def load_csv_data(table_name):
 @tracer.capture_method
 def write_to_dynamo(rows, table_name):
     try:
-        table = dynamodb.Table(table_name)
+        table = clients.resource('dynamodb').Table(table_name)
     except:
         logger.exception("Error loading DynamoDB table. Check if table was created correctly and environment variable.")
 
@@ -112,6 +114,26 @@ def write_to_dynamo(rows, table_name):
         logger.exception("Exception occurred")
 
 
+@tracer.capture_method
+def write_snapshot(rows, bucket_name, table_name):
+    # The enrichment can join against the loaded data and skip lookups of unknown keys from
+    # the start, without waiting for the first scheduled rebuild.
+    try:
+        import snapshot
+
+        manifest = snapshot.write_snapshot(bucket_name, snapshot.SnapshotIndex.from_rows(rows), source=table_name)
+        logger.info('Reference snapshot: %s' % json.dumps(manifest))
+    except Exception:
+        logger.exception("Writing the reference snapshot failed")
+    try:
+        import existence_index
+
+        manifest = existence_index.write_index(bucket_name, [row['uuid'] for row in rows], source=table_name)
+        logger.info('Existence index: %s' % json.dumps(manifest))
+    except Exception:
+        logger.exception("Writing the existence index failed")
+
+
 def create(properties, physical_id):
     bucket_name = properties['S3Bucket']
     notification_id = properties['NotificationId']
@@ -120,7 +142,7 @@ def create(properties, physical_id):
     response = add_bucket_notification(bucket_name, notification_id, function_arn)
     logger.info('AddBucketNotification response: %s' % json.dumps(response))
     logger.info('Loading table: %s' % table_name)
-    response = load_csv_data(table_name)
+    response = load_csv_data(table_name, bucket_name)
     logger.info('AddBucketNotification response: %s' % json.dumps(response))
 
     return cfnresponse.SUCCESS, physical_id
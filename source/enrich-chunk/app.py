@@ -0,0 +1,49 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+import os
+
+import fastjsonschema
+from aws_lambda_powertools import Logger, Tracer, Metrics
+
+import existence_index
+import governor
+import row_schema
+from enrichment import EnrichmentEngine, select_fetcher
+from instrumentation import parse_chunk_path, stage_metrics
+
+metrics = Metrics()
+tracer = Tracer()
+logger = Logger()
+
+validate_row = fastjsonschema.compile(row_schema.INPUT)
+
+@metrics.log_metrics(capture_cold_start_metric=False)
+@logger.inject_lambda_context(clear_state=True)
+@tracer.capture_lambda_handler(capture_response=False)
+def lambda_handler(event, context):
+    rows = event['rows']
+    file_name, chunk = parse_chunk_path(event['FilePath'])
+    fetcher, joined = select_fetcher(len(rows))
+    # Bounded so all the chunks the governor lets run stay within the global lookup limit.
+    engine = EnrichmentEngine(fetcher, validate=validate_row,
+                              max_concurrency=governor.lookup_share(int(os.environ.get('ENRICHMENT_MAX_CONCURRENCY', 32))),
+                              existence=existence_index.current_index())
+
+    with stage_metrics("enrich-chunk", file_name, chunk) as recorder:
+        with recorder.phase("Enrich"):
+            results = engine.run(rows)
+
+        # Rejected rows keep their error-info; the write step stores them with the
+        # chunk's other errors.
+        recorder.add_rows(len(results))
+        recorder.add_consumed_capacity({'CapacityUnits': engine.stats['consumed_capacity']})
+        recorder.increment("ErrorRows", engine.stats['invalid'] + engine.stats['not_found'])
+        recorder.increment("Throttles", engine.stats['throttles'])
+        recorder.increment("EnrichmentConcurrency", engine.stats['final_concurrency'])
+        recorder.increment("SnapshotJoins", int(joined))
+        recorder.increment("IndexRejectedRows", engine.stats['index_rejected'])
+        recorder.increment("IndexFalsePositives", engine.stats['index_false_positives'])
+
+    logger.info("Enriched chunk", snapshot_join=joined, **engine.stats)
+    return results
+
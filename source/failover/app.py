@@ -1,9 +1,10 @@
 import os
 import json
-import boto3
 from aws_lambda_powertools import Logger, Tracer, Metrics
 from aws_lambda_powertools.metrics import MetricUnit
 
+import clients
+
 metrics = Metrics()
 tracer = Tracer()
 logger = Logger()
@@ -33,7 +34,7 @@ def get_current_routing_control_state(event, context):
     for region, endpoint in endpoints.items():
         try:
             logger.info("route 53 recover cluster endpoint: " + endpoint)
-            client = boto3.client('route53-recovery-cluster', region_name=region, endpoint_url=endpoint)
+            client = get_cluster_client(region, endpoint)
             routing_control_state = client.get_routing_control_state(RoutingControlArn=routing_control_arn)
 
             logger.info("routing Control State is " + routing_control_state["RoutingControlState"])
@@ -54,7 +55,7 @@ def rotate_arc_controls(event, context):
     for region, endpoint in endpoints.items():
         try:
             logger.info("route 53 recovery cluster endpoint: " + endpoint)
-            client = boto3.client('route53-recovery-cluster', region_name=region, endpoint_url=endpoint)
+            client = get_cluster_client(region, endpoint)
 
             logger.info("toggling routing control")
             routing_control_state = client.get_routing_control_state(RoutingControlArn=routing_control_arn)
@@ -81,6 +82,15 @@ def rotate_arc_controls(event, context):
     return {'routing_control_state': updated_routing_control_state}
 
 
+def get_cluster_client(region, endpoint):
+    # The endpoints are tried one after the other, so a slow or unreachable endpoint has to
+    # fail fast instead of holding up the failover for the default botocore timeouts.
+    timeout = float(os.environ.get('ARC_ENDPOINT_TIMEOUT', 2))
+    return clients.client('route53-recovery-cluster', region_name=region, endpoint_url=endpoint,
+                          config={'connect_timeout': timeout, 'read_timeout': timeout,
+                                  'retries': {'mode': 'standard', 'max_attempts': 2}})
+
+
 def dummy(event, context):
     logger.info("dummy")
 
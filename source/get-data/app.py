@@ -1,22 +1,24 @@
 # Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
 # SPDX-License-Identifier: MIT-0
-import boto3
 import os
 import json
 from botocore.exceptions import ClientError
 from aws_lambda_powertools.utilities.validation import validate
 from aws_lambda_powertools.utilities.validation.exceptions import SchemaValidationError
+import clients
+import existence_index
 import schemas
 from aws_lambda_powertools import Logger, Tracer, Metrics
 from aws_lambda_powertools.logging import correlation_paths
+from aws_lambda_powertools.metrics import MetricUnit
 
+metrics = Metrics()
 tracer = Tracer()
 logger = Logger()
 
-dynamodb = boto3.resource('dynamodb')
 
-
-@logger.inject_lambda_context(log_event=True, clear_state=True, correlation_id_path=correlation_paths.API_GATEWAY_REST)
+@metrics.log_metrics(capture_cold_start_metric=False)
+@logger.inject_lambda_context(clear_state=True, correlation_id_path=correlation_paths.API_GATEWAY_REST)
 @tracer.capture_lambda_handler
 def lambda_handler(event, context):
     request = event.get('pathParameters')
@@ -30,20 +32,38 @@ def lambda_handler(event, context):
     except SchemaValidationError as e:
         return {"response": "failure", "error": e}
 
+    # A uuid that is not in the existence index has no financial data; answer without
+    # reading the table.
+    index = existence_index.current_index()
+    if index is not None and uuid not in index:
+        metrics.add_metric(name="IndexRejectedRows", unit=MetricUnit.Count, value=1)
+        return {
+            'statusCode': 200,
+            'body': json.dumps({"item": None})
+        }
+
     table_name = os.environ['TABLE_NAME']
 
-    table = dynamodb.Table(table_name)
+    table = clients.resource('dynamodb').Table(table_name)
 
     try:
         response = table.get_item(
             Key={
                 'uuid': request.get('uuid')
-            }
+            },
+            ReturnConsumedCapacity='TOTAL'
         )
-    except ClientError as e:
+    except ClientError:
         logger.exception("Exception occurred while accessing DDB Table")
-    else:
-        item = response['Item']
+        raise
+
+    metrics.add_metric(name="DynamoDBConsumedCapacity", unit=MetricUnit.Count,
+                       value=response['ConsumedCapacity']['CapacityUnits'])
+    # A uuid without financial data is answered with a null item, so the caller rejects
+    # the row instead of retrying the request.
+    item = response.get('Item')
+    if item is None and index is not None:
+        metrics.add_metric(name="IndexFalsePositives", unit=MetricUnit.Count, value=1)
 
     return {
         'statusCode': 200,
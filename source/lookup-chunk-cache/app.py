@@ -0,0 +1,35 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+from aws_lambda_powertools import Logger, Tracer, Metrics
+
+import clients
+import result_cache
+import s3_stream
+from instrumentation import parse_chunk_path, stage_metrics, track_s3_requests
+
+metrics = Metrics()
+tracer = Tracer()
+logger = Logger()
+
+
+@metrics.log_metrics(capture_cold_start_metric=False)
+@logger.inject_lambda_context(clear_state=True)
+@tracer.capture_lambda_handler
+def lambda_handler(event, context):
+    """
+    Reuses the stored result of a chunk with the same content and reference data version,
+    so the chunk processor can skip reading, enriching and writing it.
+    """
+    file_path = event['FilePath']
+    content_hash = event.get('ContentHash')
+    file_name, chunk = parse_chunk_path(file_path)
+    track_s3_requests(clients.client('s3'))
+    hit = False
+    with stage_metrics("result-cache", file_name, chunk) as recorder:
+        if content_hash and result_cache.enabled():
+            with recorder.phase("Lookup"):
+                hit = result_cache.restore(s3_stream.split_path(file_path)[0], file_path, content_hash)
+        recorder.increment("CacheHits", int(hit))
+        recorder.increment("CacheMisses", int(not hit))
+    logger.info({"Chunk": file_path, "cache hit": hit})
+    return {"hit": hit}
@@ -1,24 +1,39 @@
 # Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
 # SPDX-License-Identifier: MIT-0
-import boto3
+import csv
+import functools
+import io
+import json
+import os
+
 from aws_lambda_powertools import Logger, Tracer, Metrics
+
+import checkpoint
+import clients
+import partitioned_output
+import s3_stream
+from audit import AuditTrail
+from error_sink import ERROR_FIELDS, ERROR_FOLDER
+from instrumentation import stage_metrics, track_s3_requests
+
+# The index of a partitioned output is stored next to it as <output key>.index.json.
+INDEX_SUFFIX = ".index.json"
+
 metrics = Metrics()
 tracer = Tracer()
 logger = Logger()
-s3_client = boto3.client('s3')
 
 @metrics.log_metrics(capture_cold_start_metric=False)
-@logger.inject_lambda_context(log_event=True, clear_state=True)
+@logger.inject_lambda_context(clear_state=True)
 @tracer.capture_lambda_handler
 def lambda_handler(event, context):
     bucket = event['bucket']
     key = event['key']
     to_process_folder = event['toProcessFolder']
-    data = []
+    audit = AuditTrail("merge", key)
+    s3_client = track_s3_requests(clients.client('s3'))
     output_path = to_process_folder.replace("to_process", "output")
 
-    output = []
-
     header_text = [
         'uuid',
         'Country',
@@ -37,48 +52,104 @@ def lambda_handler(event, context):
 
     ]
 
-    output.append(",".join(header_text) + "\n")
-
     try:
-        for item in s3_client.list_objects_v2(Bucket=bucket, Prefix=output_path)['Contents']:
-            if item['Key'].endswith('.csv'):
-                resp = s3_client.select_object_content(
-                    Bucket=bucket,
-                    Key=item['Key'],
-                    ExpressionType='SQL',
-                    Expression="select * from s3object",
-                    InputSerialization={'CSV': {"FileHeaderInfo": "NONE"}, 'CompressionType': 'NONE'},
-                    OutputSerialization={'CSV': {}},
-                )
-
-                for event in resp['Payload']:
-                    if 'Records' in event:
-                        records = event['Records']['Payload'].decode('utf-8')
-                        payloads = (''.join(response for response in records))
-                        output.append(payloads)
-
-        output_body = "".join(output)
-        s3_target_key = output_path + "/" + get_output_filename(key)
-        response = s3_client.put_object(Bucket=bucket,
-                                        Key=s3_target_key,
-                                        Body=output_body)
-
-        line_num = 0
-        lines = output_body.splitlines();
-        for line in lines:
-            words = line.split(",")
-            if line_num > 0:
-                data.append(words[0])
-            line_num += 1
-
-        logger.info("Data", input_file=key, data=data)
-        return {"response": response, "S3OutputFileName": s3_target_key, "originalFileName": key}
+        with stage_metrics("merge", key) as recorder:
+            with recorder.phase("List"):
+                chunk_records, manifest = list_chunk_outputs(bucket, output_path)
+            chunk_keys = [record['output'] for record in chunk_records]
+
+            s3_target_key = output_path + "/" + get_output_filename(key)
+            # A failed merge aborts the upload instead of publishing a truncated output file.
+            with s3_stream.open_text_writer(bucket, s3_target_key) as out_file:
+                columns = partitioned_output.partition_columns()
+                if columns:
+                    file_writer = partitioned_output.PartitionedWriter(header_text, columns)
+                else:
+                    out_file.write(",".join(header_text) + "\n")
+                    # The chunk files are fully quoted; write the rows with minimal quoting as before.
+                    file_writer = csv.writer(out_file, lineterminator="\n")
+
+                chunks = s3_stream.prefetch(functools.partial(s3_stream.read_object, bucket), chunk_keys,
+                                            int(os.environ.get('S3_READ_AHEAD', 4)))
+                for _ in chunk_keys:
+                    with recorder.phase("Read"):
+                        body = next(chunks)
+                    recorder.add_bytes_read(len(body))
+                    with recorder.phase("Write"):
+                        for row in csv.reader(io.StringIO(body.decode('utf-8'))):
+                            file_writer.writerow(row)
+                            audit.add(row[0])
+
+                s3_index_key = None
+                with recorder.phase("Write"):
+                    if columns:
+                        out_file.flush()
+                        index = file_writer.close(out_file.buffer)
+                    out_file.close()
+            recorder.add_bytes_written(out_file.buffer.raw.bytes_written)
+            if columns:
+                s3_index_key = s3_target_key + INDEX_SUFFIX
+                write_index(s3_client, bucket, s3_index_key, dict(index, file=key, output=s3_target_key))
+                recorder.increment("Partitions", len(index['partitions']))
+            recorder.add_rows(audit.count)
+
+            # The error totals come from the chunk completion records, not from the table.
+            # Rows rejected by the split's inline validation come first.
+            error_records = [manifest or {}] + chunk_records
+            error_rows = sum(record.get('errors', 0) for record in error_records)
+            error_files = [record['errorFile'] for record in error_records if record.get('errorFile')]
+            s3_error_key = None
+            if error_files:
+                with recorder.phase("Errors"):
+                    s3_error_key = "/".join([output_path.split("/")[0], ERROR_FOLDER, get_output_filename(key)])
+                    merge_error_files(bucket, error_files, s3_error_key)
+            recorder.increment("ErrorRows", error_rows)
+
+        audit.log(logger)
+        audit.write_manifest(s3_client, bucket, os.path.join(to_process_folder.split("/")[0], os.path.basename(key)))
+        logger.info({"Merged file": s3_target_key, "rows": audit.count, "error rows": error_rows,
+                     "error file": s3_error_key})
+        return {"response": "success", "S3OutputFileName": s3_target_key, "originalFileName": key,
+                "errorRows": error_rows, "S3ErrorFileName": s3_error_key, "S3IndexFileName": s3_index_key}
 
     except Exception as e:
         logger.exception("Exception occurred while merging files")
         raise Exception(str(e))
 
 
+def list_chunk_outputs(bucket, output_path):
+    """
+    Returns the completion records of the chunks in chunk order and the split manifest.
+    When the split recorded its parts, every part must have a record, including the ones
+    written by earlier runs of the same file, and records of other parts are left out.
+    """
+    folder = output_path.split("/")[0]
+    manifest = checkpoint.read_split_manifest(bucket, folder)
+    if manifest is None:
+        # Skip the merged output itself so a retried merge does not include it.
+        return [{"output": chunk_key} for chunk_key in s3_stream.list_keys(bucket, output_path)
+                if chunk_key.endswith('.csv') and "/completed/" not in chunk_key], None
+
+    completed = checkpoint.completed_chunks(bucket, folder, manifest['parts'])
+    missing = checkpoint.pending_parts(manifest['parts'], completed)
+    if missing:
+        raise Exception("%d of %d chunks have not completed: %s" % (len(missing), len(manifest['parts']), missing))
+    return [completed[checkpoint.chunk_index(part)] for part in manifest['parts']], manifest
+
+
+def write_index(s3_client, bucket, index_key, index):
+    s3_client.put_object(Bucket=bucket, Key=index_key, Body=json.dumps(index).encode('utf-8'),
+                         ContentType='application/json')
+
+
+def merge_error_files(bucket, error_files, s3_error_key):
+    with s3_stream.open_text_writer(bucket, s3_error_key) as error_file:
+        error_file.write(",".join(ERROR_FIELDS) + "\n")
+        for body in s3_stream.prefetch(functools.partial(s3_stream.read_object, bucket), error_files,
+                                       int(os.environ.get('S3_READ_AHEAD', 4))):
+            error_file.write(body.decode('utf-8'))
+
+
 def get_output_filename(key):
     last_part_pos = key.rfind("/")
     if last_part_pos == -1:
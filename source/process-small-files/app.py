@@ -0,0 +1,189 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+import csv
+import os
+
+import fastjsonschema
+from aws_lambda_powertools import Logger, Tracer, Metrics
+from aws_lambda_powertools.metrics import MetricUnit
+
+import clients
+import existence_index
+import governor
+import row_schema
+import s3_stream
+from audit import AuditTrail
+from enrichment import EnrichmentEngine, select_fetcher
+from error_sink import ErrorSink
+from instrumentation import stage_metrics, track_s3_requests
+
+metrics = Metrics()
+tracer = Tracer()
+logger = Logger()
+
+validate_row = fastjsonschema.compile(row_schema.INPUT)
+
+header = [
+    'uuid',
+    'country',
+    'itemType',
+    'salesChannel',
+    'orderPriority',
+    'orderDate',
+    'region',
+    'shipDate'
+]
+
+header_text = [
+    'uuid',
+    'Country',
+    'Item Type',
+    'Sales Channel',
+    'Order Priority',
+    'Order Date',
+    'Region',
+    'Ship Date',
+    'Units Sold',
+    'Unit Price',
+    'Unit Cost',
+    'Total Revenue',
+    'Total Cost',
+    'Total Profit'
+]
+
+
+@metrics.log_metrics(capture_cold_start_metric=False)
+@logger.inject_lambda_context(clear_state=True)
+@tracer.capture_lambda_handler(capture_response=False)
+def lambda_handler(event, context):
+    """
+    Processes a batch of small files in one invocation. Each file is read, validated and
+    enriched, and written to the same output, error and archive locations the chunked
+    workflow uses, so everything after it (the email, the batch-state entry) is unchanged.
+    The rows of all files are enriched together, so the lookups are batched across files.
+
+    The inputs are only archived once every output is written, and a retry reads the
+    files a previous attempt already archived from the archive folder, so the state
+    machine can retry the whole batch.
+    """
+    track_s3_requests(clients.client('s3'))
+    files = []
+    failed = []
+    for small_file in event['files']:
+        try:
+            files.append((small_file, read_rows(small_file)))
+        except Exception:
+            logger.exception({"Small file read error": small_file['key']})
+            failed.append(small_file)
+
+    rows = [row for _, file_rows in files for row in file_rows]
+    fetcher, joined = select_fetcher(len(rows))
+    # The batch holds no governor slot, so it keeps to the lookups of one chunk.
+    engine = EnrichmentEngine(fetcher, validate=validate_row, existence=existence_index.current_index(),
+                              max_concurrency=governor.lookup_share(int(os.environ.get('ENRICHMENT_MAX_CONCURRENCY', 32))))
+    with stage_metrics("process-small-files", "batch") as recorder:
+        with recorder.phase("Enrich"):
+            results = engine.run(rows)
+        recorder.increment("SnapshotJoins", int(joined))
+        recorder.increment("IndexRejectedRows", engine.stats['index_rejected'])
+        recorder.increment("IndexFalsePositives", engine.stats['index_false_positives'])
+        recorder.add_rows(len(results))
+        recorder.add_consumed_capacity({'CapacityUnits': engine.stats['consumed_capacity']})
+        recorder.increment("Throttles", engine.stats['throttles'])
+
+    processed = []
+    offset = 0
+    for small_file, rows in files:
+        file_results = results[offset:offset + len(rows)]
+        offset += len(rows)
+        try:
+            processed.append(write_file(small_file, file_results))
+        except Exception:
+            logger.exception({"Small file write error": small_file['key']})
+            failed.append(small_file)
+    # A failed archive fails the task; the retry rewrites the same outputs and archives
+    # the remaining files.
+    for small_file, _ in files:
+        if small_file not in failed and not small_file.get('archived'):
+            archive(small_file)
+
+    # Failed files keep their INITIALIZED status in the batch-state table, so the
+    # reconciliation resubmits them like any other file that did not finish.
+    metrics.add_metric(name="SmallFilesProcessed", unit=MetricUnit.Count, value=len(processed))
+    metrics.add_metric(name="SmallFilesFailed", unit=MetricUnit.Count, value=len(failed))
+    logger.info({"Small files processed": len(processed), "failed": [f['key'] for f in failed], **engine.stats})
+    return {"files": processed, "failed": [f['key'] for f in failed]}
+
+
+def read_rows(small_file):
+    from botocore.exceptions import ClientError
+
+    try:
+        return _read_rows(small_file, small_file['key'])
+    except ClientError as e:
+        if e.response['Error']['Code'] not in ('NoSuchKey', '404'):
+            raise
+    # An earlier attempt of the batch wrote the file's output and archived it.
+    small_file['archived'] = True
+    return _read_rows(small_file, archive_key(small_file))
+
+
+def _read_rows(small_file, key):
+    rows = []
+    with s3_stream.open_text_reader(small_file['bucket'], key, size=small_file['size']) as in_file:
+        reader = csv.reader(in_file, delimiter=small_file['fileDelimiter'])
+        next(reader, None)
+        for row in reader:
+            rows.append({header[i]: row[i] for i in range(len(header))})
+    return rows
+
+
+def write_file(small_file, results):
+    bucket = small_file['bucket']
+    key = small_file['key']
+    name = os.path.basename(key)
+    # Same locations as the merge of a chunked file: <file id>/output/completed/<name> and
+    # <file id>/errors/completed/<name>.
+    output_key = "/".join([small_file['fileId'], "output", "completed", name])
+    audit = AuditTrail("process-small-files", key)
+    errors = ErrorSink(os.environ['ERROR_TABLE_NAME'], bucket, small_file['fileId'], "completed/" + name,
+                       header=True)
+    with stage_metrics("process-small-files", key) as recorder:
+        with recorder.phase("Write"), s3_stream.open_text_writer(bucket, output_key) as out_file:
+            out_file.write(",".join(header_text) + "\n")
+            file_writer = csv.writer(out_file, lineterminator="\n")
+            for data in results:
+                if 'error-info' in data:
+                    errors.add(data)
+                    continue
+                file_writer.writerow(convert_to_list(data))
+                audit.add(data['uuid'])
+        recorder.add_bytes_written(out_file.buffer.raw.bytes_written)
+        recorder.add_rows(audit.count)
+        with recorder.phase("Errors"):
+            error_file = errors.flush()
+        recorder.increment("ErrorRows", errors.count)
+    audit.log(logger)
+    audit.write_manifest(clients.client('s3'), bucket, "/".join([small_file['fileId'], name]))
+    return {"bucket": bucket, "S3OutputFileName": output_key, "originalFileName": key,
+            "errorRows": errors.count, "S3ErrorFileName": error_file}
+
+
+def convert_to_list(data):
+    item = data['financialdata']['item']
+    return [data['uuid'], data['country'], data['itemType'], data['salesChannel'], data['orderPriority'],
+            data['orderDate'], data['region'], data['shipDate'],
+            item['unitsSold'], item['unitPrice'], item['unitCost'],
+            item['totalRevenue'], item['totalCost'], item['totalProfit']]
+
+
+def archive_key(small_file):
+    return os.path.join(small_file['inputArchiveFolder'], os.path.basename(small_file['key']))
+
+
+@tracer.capture_method
+# Move the original input file into the archive folder, as the split does for large files.
+def archive(small_file):
+    s3_stream.copy_object(small_file['bucket'], small_file['key'], small_file['bucket'], archive_key(small_file))
+    s3_stream.delete_object(small_file['bucket'], small_file['key'])
+
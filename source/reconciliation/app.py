@@ -2,16 +2,18 @@ import json
 import logging
 import os
 
-import boto3
-from boto3.dynamodb.conditions import Key
 from aws_lambda_powertools import Logger, Tracer, Metrics
 from aws_lambda_powertools.metrics import MetricUnit
 
+import batch_state
+import checkpoint
+import clients
+import governor
+import s3_stream
+
 metrics = Metrics()
 tracer = Tracer()
 logger = Logger()
-ddb_client = boto3.resource('dynamodb')
-s3 = boto3.resource('s3')
 
 @metrics.log_metrics(capture_cold_start_metric=False)
 @logger.inject_lambda_context(log_event=True, clear_state=True)
@@ -20,34 +22,44 @@ def lambda_handler(event, context):
     table_name = os.environ['BATCH_STATE_DDB']
     # runtime_region = os.environ['AWS_REGION']
     secondary_region_bucket = os.environ['SECONDARY_REGION_BUCKET']
-    table = ddb_client.Table(table_name)
-    resp = table.query(
-        # Add the name of the index you want to use in your query.
-        IndexName="status-index",
-        KeyConditionExpression=Key('status').eq('INITIALIZED'))
-    logger.info({"Number of total unprocessed files:", len(resp['Items'])})
+    table = clients.resource('dynamodb').Table(table_name)
+    unprocessed_items = batch_state.query_status(table, 'INITIALIZED')
+    logger.info({"Number of total unprocessed files:", len(unprocessed_items)})
     copied_files = []
-    for item in resp['Items']:
+    for item in unprocessed_items:
         logger.info(item)
         record_obj = item['s3NotificationEvent']
         logger.info({'s3_event_record_obj: ', json.dumps(record_obj)})
         s3_event = json.loads(record_obj)
-        key = s3_event['Records']['s3']['object']['key']
+        s3_object = s3_event['Records']['s3']['object']
+        key = s3_object['key']
+        file_id = item.get('fileId') or checkpoint.file_id(key, s3_object.get('eTag'))
         try:
+            # The parts and finished chunks replicated from the failed region are reused
+            # by the split, which finds them in the folder named by the file id.
+            # The split archives the input once it has been split, and the delete is
+            # replicated too, so a file that got that far is resubmitted from the archive.
+            source_key = key
+            if not s3_stream.exists(secondary_region_bucket, key):
+                source_key = os.path.join(s3_event['inputArchiveFolder'], os.path.basename(key))
             copy_source = {
                 'Bucket': secondary_region_bucket,
-                'Key': key
+                'Key': source_key
             }
-            bucket = s3.Bucket(secondary_region_bucket)
-            response_data = bucket.copy(copy_source, key)
-            logger.info({"----- file copied successfully: ", json.dumps(response_data)})
+            # Resubmitting with the file id in the metadata keeps the folder, even though
+            # the copy gets a new ETag.
+            clients.client('s3').copy(copy_source, secondary_region_bucket, key, ExtraArgs={
+                'Metadata': {checkpoint.FILE_ID_METADATA: file_id,
+                             governor.WEIGHT_METADATA: str(s3_event.get('weight', 1))},
+                'MetadataDirective': 'REPLACE'
+            })
 
         except Exception as err:
             logger.exception({"Error while copying Input File:", key})
 
         else:
             copied_files.append(key)
-            logger.info({"file submitted for processing": key, "response_data": json.dumps(response_data)})
+            logger.info({"file submitted for processing": key, "source": source_key, "fileId": file_id})
     metrics.add_metric(name="ReconciledFiles", unit=MetricUnit.Count, value=len(copied_files))
     return {
         'num_files_submitted_for_reconciliation': len(copied_files),
@@ -2,59 +2,64 @@
 # SPDX-License-Identifier: MIT-0
 import json
 import os
-import boto3
 import time
 import logging
 from datetime import date, datetime
-import dns.resolver
 from aws_lambda_powertools import Logger, Tracer, Metrics
 from aws_lambda_powertools.metrics import MetricUnit
 
+import batch_state
+import checkpoint
+import clients
+import governor
+
 metrics = Metrics()
 tracer = Tracer()
 logger = Logger()
 
-state_machine_client = boto3.client('stepfunctions')
-dynamodb = boto3.resource('dynamodb')
-
 @tracer.capture_method
 def write_to_ddb(fileName, status, process_date, start_time, param):
     table_name = os.environ['BATCH_STATE_DDB']
-    table = dynamodb.Table(table_name)
+    table = clients.resource('dynamodb').Table(table_name)
     runtime_region = os.environ['AWS_REGION']
     event_object = json.dumps(param)
     response = table.put_item(
         Item={
             'fileName': fileName,
-            'status': status,
+            **batch_state.status_attributes(status, fileName),
             'processDate': process_date,
             'startTime': start_time,
             'processingInitializedRegion': runtime_region,
+            'fileId': param['fileId'],
             's3NotificationEvent': event_object
 
         }
     )
     return response
 
+def is_small_file(record):
+    max_bytes = int(os.environ.get('SMALL_FILE_MAX_BYTES', 0))
+    return max_bytes > 0 and record['s3']['object'].get('size', max_bytes + 1) <= max_bytes
+
 @tracer.capture_method
 def resolve_secret_value(param):
-    session = boto3.session.Session()
-    client = session.client(
-        service_name='secretsmanager',
-        region_name=os.environ['AWS_REGION'],
-    )
-    get_secret_value_response = client.get_secret_value(
-        SecretId=param
-    )
-    return get_secret_value_response['SecretString']
+    return clients.secret_value(param)
+
+
+@tracer.capture_method
+def resolve_primary_region(domain_name):
+    # Imported on first use instead of at module load, like the AWS clients in clients.py.
+    import dns.resolver
+
+    answers = dns.resolver.query(domain_name, 'TXT')
+    return answers[0].to_text().replace('"', '')
 
 @metrics.log_metrics(capture_cold_start_metric=False)
 @logger.inject_lambda_context(log_event=True, clear_state=True)
 @tracer.capture_lambda_handler
 def lambda_handler(event, context):
     domain_name = resolve_secret_value(os.environ['DNS_RECORD_SECRET'])
-    answers = dns.resolver.query(domain_name, 'TXT')
-    primary_region = answers[0].to_text().replace('"', '')
+    primary_region = resolve_primary_region(domain_name)
     current_region = os.environ['AWS_REGION']
     logger.info({"Primary Region": primary_region, "Current Region": current_region})
     if current_region == primary_region:
@@ -70,15 +75,28 @@ def lambda_handler(event, context):
             state_machine_execution_name = os.environ['STATE_MACHINE_EXECUTION_NAME'] + str(time.time())
             bucket = record['s3']['bucket']['name']
             key = record['s3']['object']['key']
+            metadata = checkpoint.object_metadata(bucket, key)
+            # Identifies the folder of the file's chunks, so a resubmitted file resumes there.
+            param['fileId'] = checkpoint.resolve_file_id(bucket, key, record['s3']['object'].get('eTag'), metadata)
+            # Share of the chunk slots the file gets while other files are waiting for them.
+            param['weight'] = governor.file_weight(metadata)
             current_date = date.today().strftime('%m/%d/%Y')
             current_time = datetime.now().strftime("%H:%M:%S")
             responseData = {}
             try:
-                responseData['step_function_response'] = state_machine_client.start_execution(
-                    stateMachineArn=state_machine_arn,
-                    name=state_machine_execution_name,
-                    input=json.dumps(param)
-                )
+                if is_small_file(record):
+                    # Small files are batched by the coalescing function; each keeps its own
+                    # state table entry and output.
+                    responseData['small_file_queue_response'] = clients.client('sqs').send_message(
+                        QueueUrl=os.environ['SMALL_FILE_QUEUE_URL'],
+                        MessageBody=json.dumps(param)
+                    )
+                else:
+                    responseData['step_function_response'] = clients.client('stepfunctions').start_execution(
+                        stateMachineArn=state_machine_arn,
+                        name=state_machine_execution_name,
+                        input=json.dumps(param)
+                    )
                 write_to_ddb(key, 'INITIALIZED', current_date, current_time, param)
                 responseData['ddb_state_table_put'] = 'SUCCESS'
                 logging.info({"File": key, "Bucket": bucket, "Status": "Initialized", "Response Data": responseData})
@@ -8,27 +8,19 @@ import os
 import smtplib
 from email.message import EmailMessage
 
-import boto3
 from aws_lambda_powertools import Logger, Tracer, Metrics
 from aws_lambda_powertools.metrics import MetricUnit
 
+import batch_state
+import clients
+
 metrics = Metrics()
 tracer = Tracer()
 logger = Logger()
-s3_client = boto3.client('s3')
-ddb_client = boto3.resource('dynamodb')
 
 @tracer.capture_method
 def get_mrap_alias(mrap_alias_secret):
-    session = boto3.session.Session()
-    client = session.client(
-        service_name='secretsmanager',
-        region_name=os.environ['AWS_REGION'],
-    )
-    get_secret_value_response = client.get_secret_value(
-        SecretId=mrap_alias_secret
-    )
-    return get_secret_value_response['SecretString']
+    return clients.secret_value(mrap_alias_secret)
 
 @metrics.log_metrics(capture_cold_start_metric=False)
 @logger.inject_lambda_context(log_event=True, clear_state=True)
@@ -56,7 +48,7 @@ def lambda_handler(event, context):
 
 @tracer.capture_method
 def generate_s3_signed_url(account_id, mrap_alias, s3_target_key):
-    return s3_client.generate_presigned_url(HttpMethod='GET',
+    return clients.client('s3').generate_presigned_url(HttpMethod='GET',
                                             ClientMethod='get_object',
                                             Params={'Bucket': 'arn:aws:s3::' + account_id + ':accesspoint/' + mrap_alias,
                                                     'Key': s3_target_key},
@@ -68,16 +60,21 @@ def update_status(file_name):
     table_name = os.environ['BATCH_STATE_DDB']
     runtime_region = os.environ['AWS_REGION']
     logger.info({"current_region", runtime_region})
-    table = ddb_client.Table(table_name)
+    table = clients.resource('dynamodb').Table(table_name)
+    status_attributes = batch_state.status_attributes(status, file_name)
     response = table.update_item(
         Key={'fileName': file_name},
-        UpdateExpression="set #status = :s, #completedRegion = :cRegion",
+        UpdateExpression="set #status = :s, #statusShard = :shard, #statusTime = :time, #completedRegion = :cRegion",
         ExpressionAttributeValues={
             ':s': status,
+            ':shard': status_attributes[batch_state.STATUS_SHARD_ATTRIBUTE],
+            ':time': status_attributes[batch_state.STATUS_TIME_ATTRIBUTE],
             ':cRegion': runtime_region
         },
         ExpressionAttributeNames={
             '#status': 'status',
+            '#statusShard': batch_state.STATUS_SHARD_ATTRIBUTE,
+            '#statusTime': batch_state.STATUS_TIME_ATTRIBUTE,
             '#completedRegion': 'processingCompletedRegion'
         },
         ReturnValues="UPDATED_NEW")
@@ -128,15 +125,7 @@ def transmit_email(email, smtp_credentials):
 
 @tracer.capture_method
 def get_smtp_credentials():
-    session = boto3.session.Session()
-    client = session.client(
-        service_name='secretsmanager',
-        region_name=os.environ['AWS_REGION'],
-    )
-    get_secret_value_response = client.get_secret_value(
-        SecretId=os.environ['SMTP_CREDENTIAL_SECRET']
-    )
-    json_secret_value = json.loads(get_secret_value_response['SecretString'])
+    json_secret_value = json.loads(clients.secret_value(os.environ['SMTP_CREDENTIAL_SECRET']))
     return json_secret_value
 
 
@@ -0,0 +1,95 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+import hashlib
+import os
+import tempfile
+
+# AUDIT_LOG_MODE selects what a stage logs about the keys it handled:
+#   summary - count, first and last key and a digest of all keys (default)
+#   sample  - the summary plus every AUDIT_SAMPLE_RATE-th key, capped at AUDIT_SAMPLE_LIMIT keys
+#   full    - the summary plus every key; only meant for debugging small files
+#   off     - nothing is logged
+SUMMARY = "summary"
+SAMPLE = "sample"
+FULL = "full"
+OFF = "off"
+
+# Keys are spooled in memory up to this size before the manifest moves to a temporary file.
+_MANIFEST_SPOOL_SIZE = 8 * 1024 * 1024
+
+
+class AuditTrail:
+    """
+    Summarizes the row keys a stage processed without keeping them all in memory.
+
+    The digest is a SHA-256 over the newline separated keys in processing order, so the
+    same file produces the same digest in every stage and in both regions. When
+    AUDIT_MANIFEST_PREFIX is set, the keys are also streamed to a manifest object in S3
+    under that prefix.
+    """
+
+    def __init__(self, stage, input_file, mode=None, sample_rate=None, sample_limit=None, manifest_prefix=None):
+        self.stage = stage
+        self.input_file = input_file
+        self.mode = mode or os.environ.get('AUDIT_LOG_MODE', SUMMARY)
+        self.sample_rate = int(sample_rate or os.environ.get('AUDIT_SAMPLE_RATE', 1000))
+        self.sample_limit = int(sample_limit or os.environ.get('AUDIT_SAMPLE_LIMIT', 100))
+        self.manifest_prefix = manifest_prefix if manifest_prefix is not None \
+            else os.environ.get('AUDIT_MANIFEST_PREFIX', '')
+        self.count = 0
+        self.first_key = None
+        self.last_key = None
+        self.sample = []
+        self._digest = hashlib.sha256()
+        self._manifest = None
+        if self.manifest_prefix:
+            self._manifest = tempfile.SpooledTemporaryFile(max_size=_MANIFEST_SPOOL_SIZE)
+
+    def add(self, key):
+        if self.count == 0:
+            self.first_key = key
+        self.last_key = key
+        line = (key + "\n").encode('utf-8')
+        self._digest.update(line)
+        if self._manifest is not None:
+            self._manifest.write(line)
+        if self.mode == FULL or (self.mode == SAMPLE and self.count % self.sample_rate == 0
+                                 and len(self.sample) < self.sample_limit):
+            self.sample.append(key)
+        self.count += 1
+
+    def summary(self):
+        summary = {
+            "stage": self.stage,
+            "input_file": self.input_file,
+            "count": self.count,
+            "first_key": self.first_key,
+            "last_key": self.last_key,
+            "sha256": self._digest.hexdigest(),
+        }
+        if self.mode == FULL:
+            summary["keys"] = self.sample
+        elif self.mode == SAMPLE:
+            summary["sampled_keys"] = self.sample
+            summary["sample_rate"] = self.sample_rate
+        return summary
+
+    def log(self, logger):
+        if self.mode != OFF:
+            logger.info("Audit", **self.summary())
+
+    def write_manifest(self, s3_client, bucket, name):
+        """
+        Uploads the streamed keys to <AUDIT_MANIFEST_PREFIX>/<stage>/<name>.keys and returns
+        the manifest key, or None when manifests are disabled.
+        """
+        if self._manifest is None:
+            return None
+        manifest_key = "/".join([self.manifest_prefix.rstrip("/"), self.stage, name + ".keys"])
+        self._manifest.seek(0)
+        s3_client.upload_fileobj(self._manifest, bucket, manifest_key,
+                                 ExtraArgs={'Metadata': {'sha256': self._digest.hexdigest(),
+                                                         'count': str(self.count)}})
+        self._manifest.close()
+        self._manifest = None
+        return manifest_key
@@ -0,0 +1,66 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+import os
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+# The batch-state table is indexed by a sharded status key ("INITIALIZED#3") with the time
+# of the last status change as the sort key, so files in the same status are spread over
+# STATUS_SHARDS index partitions instead of one. Writers and readers must use the same
+# number of shards; it can be raised later, but readers then need the higher value.
+STATUS_INDEX = "status-shard-index"
+STATUS_SHARD_ATTRIBUTE = "statusShard"
+STATUS_TIME_ATTRIBUTE = "statusTime"
+
+
+def _shards():
+    return int(os.environ.get('STATUS_SHARDS', 10))
+
+
+def shard_key(status, file_name, shards=None):
+    # crc32 instead of hash() so the shard of a file is stable across processes.
+    shard = zlib.crc32(file_name.encode('utf-8')) % (shards or _shards())
+    return "%s#%d" % (status, shard)
+
+
+def status_attributes(status, file_name):
+    """
+    Returns the attributes to write with a status change: the plain status, its shard
+    key and the change time.
+    """
+    return {
+        'status': status,
+        STATUS_SHARD_ATTRIBUTE: shard_key(status, file_name),
+        STATUS_TIME_ATTRIBUTE: datetime.now(timezone.utc).isoformat(),
+    }
+
+
+def _query_shard(table, shard, since):
+    from boto3.dynamodb.conditions import Key
+
+    condition = Key(STATUS_SHARD_ATTRIBUTE).eq(shard)
+    if since is not None:
+        condition = condition & Key(STATUS_TIME_ATTRIBUTE).gte(since)
+    items = []
+    kwargs = {'IndexName': STATUS_INDEX, 'KeyConditionExpression': condition}
+    while True:
+        response = table.query(**kwargs)
+        items.extend(response['Items'])
+        if 'LastEvaluatedKey' not in response:
+            return items
+        kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+
+def query_status(table, status, since=None, shards=None):
+    """
+    Returns every item in the given status, oldest status change first, querying all
+    shards of the index in parallel. `since` is an ISO 8601 time that limits the results
+    to files whose status changed at or after it.
+    """
+    shards = shards or _shards()
+    keys = ["%s#%d" % (status, shard) for shard in range(shards)]
+    with ThreadPoolExecutor(max_workers=min(shards, 16)) as executor:
+        results = executor.map(lambda key: _query_shard(table, key, since), keys)
+        items = [item for shard_items in results for item in shard_items]
+    return sorted(items, key=lambda item: item.get(STATUS_TIME_ATTRIBUTE, ''))
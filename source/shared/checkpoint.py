@@ -0,0 +1,156 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+import json
+import os
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import clients
+import s3_stream
+from instrumentation import parse_chunk_path
+
+# Layout of the per-file checkpoint state, next to the to_process and output folders so it
+# replicates with them:
+#   <file id>/to_process/_split.json      keys of the parts, written after all of them exist
+#   <file id>/checkpoints/<chunk>.json    one completion record per written output chunk
+# Both carry the REFERENCE_DATA_VERSION the chunks were enriched with. Records of another
+# version, or older than CHECKPOINT_TTL_DAYS, are ignored, so an upload of the same file
+# after the financial table was reloaded is processed again.
+SPLIT_MANIFEST = "_split.json"
+CHECKPOINT_FOLDER = "checkpoints"
+
+_FILE_ID_NAMESPACE = uuid.UUID('6f1c4d0e-3b8a-4f55-9a1e-2d7c5b9e8a41')
+# Object metadata carrying the file id of a resubmitted input, so a copy made by the
+# reconciliation after a failover resumes in the folder of the original upload even
+# though the copy has a different ETag.
+FILE_ID_METADATA = 'file-id'
+
+
+def file_id(key, etag):
+    """
+    Returns the folder name for an input file. It is derived from the object key and
+    ETag, so the same upload processed again (a retry, a replay by the reconciliation)
+    lands in the same folder and finds the chunks that were already completed.
+    """
+    return str(uuid.uuid5(_FILE_ID_NAMESPACE, key + "\n" + (etag or "")))
+
+
+def object_metadata(bucket, key):
+    """
+    Returns the user metadata of an object, or {} when it does not exist.
+    """
+    from botocore.exceptions import ClientError
+
+    try:
+        return clients.client('s3').head_object(Bucket=bucket, Key=key).get('Metadata', {})
+    except ClientError as e:
+        if e.response['Error']['Code'] not in ('NoSuchKey', '404'):
+            raise
+        return {}
+
+
+def resolve_file_id(bucket, key, etag, metadata=None):
+    """
+    Returns the file id recorded in the object's metadata, or derives it from the key and
+    ETag for a new upload.
+    """
+    if metadata is None:
+        metadata = object_metadata(bucket, key)
+    return metadata.get(FILE_ID_METADATA) or file_id(key, etag)
+
+
+def _reference_version():
+    return os.environ.get('REFERENCE_DATA_VERSION', '1')
+
+
+def _current(record, written_at):
+    if record.get('referenceVersion') != _reference_version() or not record.get(written_at):
+        return False
+    max_age = timedelta(days=int(os.environ.get('CHECKPOINT_TTL_DAYS', 7)))
+    return datetime.fromisoformat(record[written_at]) >= datetime.now(timezone.utc) - max_age
+
+
+def chunk_index(part_path):
+    return int(parse_chunk_path(part_path)[1])
+
+
+def output_key(part_key):
+    """
+    Returns the key write-output-chunk writes the enriched rows of a split part to.
+    """
+    return part_key.replace("to_process", "output")
+
+
+def _read_json(bucket, key):
+    from botocore.exceptions import ClientError
+
+    try:
+        return json.loads(s3_stream.read_object(bucket, key))
+    except ClientError as e:
+        if e.response['Error']['Code'] in ('NoSuchKey', '404'):
+            return None
+        raise
+
+
+def _write_json(bucket, key, document):
+    clients.client('s3').put_object(Bucket=bucket, Key=key, Body=json.dumps(document).encode('utf-8'),
+                                    ContentType='application/json')
+
+
+def read_split_manifest(bucket, folder):
+    return _read_json(bucket, folder + "/to_process/" + SPLIT_MANIFEST)
+
+
+def write_split_manifest(bucket, folder, manifest):
+    manifest = dict(manifest, referenceVersion=_reference_version(), splitAt=datetime.now(timezone.utc).isoformat())
+    _write_json(bucket, folder + "/to_process/" + SPLIT_MANIFEST, manifest)
+
+
+def mark_chunk_complete(bucket, folder, chunk, record):
+    record = dict(record, chunk=int(chunk), region=os.environ.get('AWS_REGION'), referenceVersion=_reference_version(),
+                  completedAt=datetime.now(timezone.utc).isoformat())
+    _write_json(bucket, "%s/%s/%s.json" % (folder, CHECKPOINT_FOLDER, chunk), record)
+
+
+def completed_chunks(bucket, folder, parts):
+    """
+    Returns {chunk index: completion record} for the chunks of the split `parts` (keys
+    without the bucket) that have been written, reading the records with one listing and
+    parallel GETs.
+
+    Only records of one of the parts whose output is that part's output key are kept, so
+    records left behind by an earlier split of the same file into more or other parts
+    are ignored. Replication does not keep the order in which objects were written, so in
+    the standby region a record can arrive before its output chunk. Records whose output
+    is not in the bucket are left out and their chunks are processed again, as are
+    records of another reference data version or older than CHECKPOINT_TTL_DAYS.
+    """
+    keys = [key for key in s3_stream.list_keys(bucket, "%s/%s/" % (folder, CHECKPOINT_FOLDER)) if key.endswith('.json')]
+    if not keys:
+        return {}
+    expected = {chunk_index(part): output_key(part) for part in parts}
+    outputs = set(s3_stream.list_keys(bucket, folder + "/output/"))
+    records = s3_stream.prefetch(lambda key: json.loads(s3_stream.read_object(bucket, key)), keys,
+                                 int(os.environ.get('S3_READ_AHEAD', 4)))
+    return {record['chunk']: record for record in records
+            if expected.get(record['chunk']) == record['output'] and record['output'] in outputs
+            and _current(record, 'completedAt')}
+
+
+def resume_state(bucket, folder):
+    """
+    Returns the split manifest and completed chunks of a file whose parts are intact in
+    the bucket, or (None, {}) when it has to be split again. A manifest of another
+    reference data version or older than CHECKPOINT_TTL_DAYS is not resumed.
+    """
+    manifest = read_split_manifest(bucket, folder)
+    if manifest is None or not _current(manifest, 'splitAt'):
+        return None, {}
+    parts = set(s3_stream.list_keys(bucket, folder + "/to_process/"))
+    if any(key not in parts for key in manifest['parts']):
+        return None, {}
+    return manifest, completed_chunks(bucket, folder, manifest['parts'])
+
+
+def pending_parts(part_paths, completed):
+    return [path for path in part_paths if chunk_index(path) not in completed]
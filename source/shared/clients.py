@@ -0,0 +1,96 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+import os
+import threading
+import time
+
+# boto3 and botocore are imported on first use so that a handler which never talks to a
+# given service does not pay for loading its client model during the cold start.
+_lock = threading.Lock()
+_session = None
+_clients = {}
+_resources = {}
+_secrets = {}
+
+
+def _default_config():
+    from botocore.config import Config
+
+    return Config(
+        max_pool_connections=int(os.environ.get('BOTO_MAX_POOL_CONNECTIONS', 50)),
+        connect_timeout=float(os.environ.get('BOTO_CONNECT_TIMEOUT', 5)),
+        read_timeout=float(os.environ.get('BOTO_READ_TIMEOUT', 60)),
+        retries={
+            'mode': os.environ.get('BOTO_RETRY_MODE', 'adaptive'),
+            'max_attempts': int(os.environ.get('BOTO_MAX_ATTEMPTS', 5)),
+        },
+        tcp_keepalive=True,
+    )
+
+
+def _get_session():
+    global _session
+    if _session is None:
+        import boto3.session
+
+        _session = boto3.session.Session()
+    return _session
+
+
+def client(service_name, region_name=None, endpoint_url=None, config=None):
+    """
+    Returns a client for the service, creating it on first use and reusing it (and its
+    connection pool) for the lifetime of the execution environment. `config` is a dict
+    of botocore Config options merged on top of the default pool, timeout and retry
+    settings, for example {'connect_timeout': 1} for endpoints that must fail fast.
+    """
+    region_name = region_name or os.environ.get('AWS_REGION')
+    cache_key = (service_name, region_name, endpoint_url, repr(sorted(config.items())) if config else None)
+    cached = _clients.get(cache_key)
+    if cached is not None:
+        return cached
+    with _lock:
+        if cache_key not in _clients:
+            merged = _default_config()
+            if config:
+                from botocore.config import Config
+
+                merged = merged.merge(Config(**config))
+            _clients[cache_key] = _get_session().client(service_name, region_name=region_name,
+                                                        endpoint_url=endpoint_url, config=merged)
+        return _clients[cache_key]
+
+
+def resource(service_name, region_name=None):
+    region_name = region_name or os.environ.get('AWS_REGION')
+    cache_key = (service_name, region_name)
+    cached = _resources.get(cache_key)
+    if cached is not None:
+        return cached
+    with _lock:
+        if cache_key not in _resources:
+            _resources[cache_key] = _get_session().resource(service_name, region_name=region_name,
+                                                            config=_default_config())
+        return _resources[cache_key]
+
+
+def credentials():
+    """
+    Returns the credentials of the shared session, for signing requests that do not go
+    through a boto3 client such as API Gateway calls with IAM authorization.
+    """
+    return _get_session().get_credentials()
+
+
+def secret_value(secret_id):
+    """
+    Returns the SecretString of a Secrets Manager secret, cached for SECRET_CACHE_TTL
+    seconds so warm invocations do not call Secrets Manager again.
+    """
+    ttl = float(os.environ.get('SECRET_CACHE_TTL', 300))
+    cached = _secrets.get(secret_id)
+    if cached is not None and time.monotonic() - cached[1] < ttl:
+        return cached[0]
+    value = client('secretsmanager').get_secret_value(SecretId=secret_id)['SecretString']
+    _secrets[secret_id] = (value, time.monotonic())
+    return value
@@ -0,0 +1,310 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+import asyncio
+import json
+import os
+import random
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+
+import clients
+
+# Error codes and HTTP statuses that mean "slow down" rather than "this request is wrong".
+_THROTTLING_ERROR_CODES = {
+    'ProvisionedThroughputExceededException',
+    'RequestLimitExceeded',
+    'ThrottlingException',
+    'TooManyRequestsException',
+}
+_THROTTLING_STATUS_CODES = {429, 503}
+
+_BASE_BACKOFF = 0.05
+_MAX_BACKOFF = 5.0
+
+
+_fetcher = None
+
+
+def _env_int(name, default):
+    return int(os.environ.get(name, default))
+
+
+class Throttled(Exception):
+    """
+    Raised by a fetcher when the backend rejected a request because of its request rate.
+    """
+
+
+class AdaptiveLimiter:
+    """
+    Bounds the requests in flight with an additive increase, multiplicative decrease
+    limit: every success grows the limit by 1/limit (about one more request per round
+    trip of the whole window) and a throttle halves it. Throttles from requests that were
+    already in flight when the limit was halved do not halve it again.
+    """
+
+    def __init__(self, initial, maximum, minimum=1):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.limit = float(max(minimum, min(initial, maximum)))
+        self.in_flight = 0
+        self.throttles = 0
+        # Requests that were in flight at the last decrease, so sent under the old limit.
+        self._stale = 0
+        self._condition = asyncio.Condition()
+
+    async def acquire(self):
+        async with self._condition:
+            await self._condition.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+
+    async def release(self, throttled=False):
+        async with self._condition:
+            self.in_flight -= 1
+            stale = self._stale > 0
+            self._stale -= stale
+            if throttled:
+                self.throttles += 1
+                if not stale:
+                    self.limit = max(self.minimum, self.limit / 2)
+                    self._stale = self.in_flight
+            else:
+                self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            # Only wake as many waiters as there are free slots.
+            self._condition.notify(max(0, int(self.limit) - self.in_flight))
+
+
+def _attribute_value(value):
+    # The financial data is stored as strings; numbers are kept as their string form so
+    # the result stays JSON serializable and is written to the CSV unchanged.
+    if 'S' in value:
+        return value['S']
+    if 'N' in value:
+        return value['N']
+    from boto3.dynamodb.types import TypeDeserializer
+
+    return TypeDeserializer().deserialize(value)
+
+
+class DynamoDBFetcher:
+    """
+    Reads the items straight from the DynamoDB table with BatchGetItem, up to 100 keys per
+    request. Unprocessed keys are handed back so they are retried as throttled.
+    """
+
+    batch_size = 100
+
+    def __init__(self, table_name, key_name='uuid'):
+        self.table_name = table_name
+        self.key_name = key_name
+
+    def fetch(self, keys):
+        from botocore.exceptions import ClientError
+
+        try:
+            response = clients.client('dynamodb').batch_get_item(
+                RequestItems={self.table_name: {'Keys': [{self.key_name: {'S': key}} for key in keys]}},
+                ReturnConsumedCapacity='TOTAL'
+            )
+        except ClientError as e:
+            if e.response['Error']['Code'] in _THROTTLING_ERROR_CODES:
+                raise Throttled(str(e)) from e
+            raise
+
+        items = {}
+        for item in response['Responses'].get(self.table_name, []):
+            item = {name: _attribute_value(value) for name, value in item.items()}
+            items[item[self.key_name]] = item
+        unprocessed = response.get('UnprocessedKeys', {}).get(self.table_name, {}).get('Keys', [])
+        consumed = sum(entry.get('CapacityUnits', 0) for entry in response.get('ConsumedCapacity', []))
+        return items, [key[self.key_name]['S'] for key in unprocessed], consumed
+
+
+class ApiFetcher:
+    """
+    Calls the get-data API (GET /financials/{uuid}) with SigV4 signed requests, one key per
+    request, over a pooled HTTP session.
+    """
+
+    batch_size = 1
+
+    def __init__(self, endpoint, region_name=None, timeout=None, max_connections=None):
+        from botocore.httpsession import URLLib3Session
+
+        self.endpoint = endpoint.rstrip('/')
+        self.region_name = region_name or os.environ.get('AWS_REGION')
+        self._session = URLLib3Session(timeout=timeout or _env_int('ENRICHMENT_API_TIMEOUT', 10),
+                                       max_pool_connections=max_connections or _env_int('ENRICHMENT_MAX_CONCURRENCY', 32))
+
+    def fetch(self, keys):
+        from botocore.auth import SigV4Auth
+        from botocore.awsrequest import AWSRequest
+
+        items = {}
+        for key in keys:
+            request = AWSRequest(method='GET', url="%s/financials/%s" % (self.endpoint, urllib.parse.quote(key)))
+            SigV4Auth(clients.credentials(), 'execute-api', self.region_name).add_auth(request)
+            response = self._session.send(request.prepare())
+            if response.status_code in _THROTTLING_STATUS_CODES:
+                raise Throttled("get-data returned %d" % response.status_code)
+            if response.status_code != 200:
+                raise RuntimeError("get-data returned %d for %s: %s" % (response.status_code, key, response.text))
+            item = json.loads(response.content).get('item')
+            if item is not None:
+                items[key] = item
+        return items, [], 0
+
+
+class EnrichmentEngine:
+    """
+    Validates a chunk of rows and looks up their financial data with a bounded, adaptive
+    number of requests in flight.
+
+    The rows come back in input order in the shape the per-row Map of the process-chunk
+    state machine produced: `validatedresult` and `financialdata.item` for enriched rows
+    and `error-info` ({"Error", "Cause"}) for rows that failed validation or have no
+    financial data. Throttled lookups are retried with jittered backoff up to max_attempts;
+    any other lookup error, or a lookup that stays throttled, is raised so the task fails
+    and Step Functions retries the chunk.
+
+    With an `existence` index (see existence_index), keys that are not in it are rejected
+    without a lookup. Keys that pass it and are still not found are its false positives.
+    """
+
+    def __init__(self, fetcher, validate=None, concurrency=None, max_concurrency=None, max_attempts=None,
+                 key_name='uuid', existence=None):
+        self.fetcher = fetcher
+        self.validate = validate
+        self.existence = existence
+        self.max_concurrency = max_concurrency or _env_int('ENRICHMENT_MAX_CONCURRENCY', 32)
+        self.concurrency = min(concurrency or _env_int('ENRICHMENT_CONCURRENCY', 8), self.max_concurrency)
+        self.max_attempts = max_attempts or _env_int('ENRICHMENT_MAX_ATTEMPTS', 8)
+        self.key_name = key_name
+        self.stats = {}
+
+    def run(self, rows):
+        return asyncio.run(self._run(rows))
+
+    async def _run(self, rows):
+        self.stats = {"rows": len(rows), "invalid": 0, "not_found": 0, "index_rejected": 0,
+                      "index_false_positives": 0, "requests": 0, "throttles": 0, "consumed_capacity": 0,
+                      "final_concurrency": self.concurrency}
+        results = [dict(row) for row in rows]
+        pending = {}
+        for index, row in enumerate(results):
+            error = self._validate(row)
+            if error is not None:
+                row['error-info'] = error
+                self.stats["invalid"] += 1
+                continue
+            row['validatedresult'] = {"response": "success"}
+            pending.setdefault(row[self.key_name], []).append(index)
+
+        if self.existence is not None:
+            for key in [key for key in pending if key not in self.existence]:
+                for index in pending.pop(key):
+                    results[index]['error-info'] = {"Error": "ItemNotFound",
+                                                    "Cause": "No financial data for uuid %s" % key}
+                    self.stats["not_found"] += 1
+                    self.stats["index_rejected"] += 1
+
+        keys = list(pending)
+        size = self.fetcher.batch_size
+        batches = asyncio.Queue()
+        for start in range(0, len(keys), size):
+            batches.put_nowait(keys[start:start + size])
+        limiter = AdaptiveLimiter(self.concurrency, self.max_concurrency)
+        outcomes = []
+
+        # A fixed pool of workers pulls the batches, so at most max_concurrency of them wait
+        # for the limiter however many batches the chunk has.
+        async def worker(executor):
+            while not batches.empty():
+                outcomes.append(await self._fetch(batches.get_nowait(), limiter, executor))
+
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+            await asyncio.gather(*(worker(executor) for _ in range(min(self.max_concurrency, batches.qsize()))))
+
+        for found, failed in outcomes:
+            for key, item in found.items():
+                for index in pending[key]:
+                    results[index]['financialdata'] = {"item": item}
+            for key, error in failed.items():
+                not_found = error["Error"] == "ItemNotFound"
+                for index in pending[key]:
+                    results[index]['error-info'] = error
+                    self.stats["not_found"] += not_found
+                    # With an existence index, every key that was looked up had passed it.
+                    self.stats["index_false_positives"] += not_found and self.existence is not None
+
+        self.stats["throttles"] = limiter.throttles
+        self.stats["final_concurrency"] = int(limiter.limit)
+        return results
+
+    def _validate(self, row):
+        if self.validate is None:
+            return None
+        try:
+            self.validate(row)
+        except Exception as e:
+            return {"Error": type(e).__name__, "Cause": str(getattr(e, 'message', e))}
+        return None
+
+    async def _fetch(self, keys, limiter, executor):
+        loop = asyncio.get_running_loop()
+        found, failed = {}, {}
+        attempt = 0
+        while keys:
+            attempt += 1
+            await limiter.acquire()
+            self.stats["requests"] += 1
+            try:
+                items, unprocessed, consumed = await loop.run_in_executor(executor, self.fetcher.fetch, keys)
+            except Throttled:
+                items, unprocessed, consumed = {}, keys, 0
+            except Exception:
+                await limiter.release()
+                raise
+            await limiter.release(throttled=bool(unprocessed))
+            self.stats["consumed_capacity"] += consumed
+
+            found.update(items)
+            retry = set(unprocessed)
+            for key in keys:
+                if key not in items and key not in retry:
+                    failed[key] = {"Error": "ItemNotFound", "Cause": "No financial data for uuid %s" % key}
+            keys = list(unprocessed)
+            if keys and attempt >= self.max_attempts:
+                raise Throttled("%d keys still throttled after %d attempts" % (len(keys), attempt))
+            if keys:
+                await asyncio.sleep(random.uniform(0, min(_MAX_BACKOFF, _BASE_BACKOFF * 2 ** attempt)))
+        return found, failed
+
+
+def default_fetcher():
+    """
+    Returns the fetcher selected by ENRICHMENT_SOURCE ("dynamodb" reads FINANCIAL_TABLE_NAME,
+    "api" calls ENRICHMENT_API_ENDPOINT). It is kept for the lifetime of the execution
+    environment so its HTTP connection pool is reused between invocations.
+    """
+    global _fetcher
+    if _fetcher is None:
+        if os.environ.get('ENRICHMENT_SOURCE', 'dynamodb') == 'api':
+            _fetcher = ApiFetcher(os.environ['ENRICHMENT_API_ENDPOINT'])
+        else:
+            _fetcher = DynamoDBFetcher(os.environ['FINANCIAL_TABLE_NAME'])
+    return _fetcher
+
+
+def select_fetcher(row_count):
+    """
+    Returns (fetcher, joined): a join against the reference snapshot when the snapshot
+    policy allows it for a batch of `row_count` rows, otherwise the point lookups of
+    default_fetcher().
+    """
+    if os.environ.get('ENRICHMENT_SNAPSHOT', 'off') != 'auto':
+        return default_fetcher(), False
+    # NumPy is only imported when snapshots are enabled, so it stays out of the cold start.
+    import snapshot
+
+    return snapshot.select_fetcher(row_count, default_fetcher())
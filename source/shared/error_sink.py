@@ -0,0 +1,73 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+import csv
+
+import clients
+import s3_stream
+
+# Rejected rows of a chunk are written to <file id>/errors/<chunk file name>; the merge
+# combines them into <file id>/errors/completed/<input file name>.
+ERROR_FOLDER = "errors"
+ERROR_FIELDS = [
+    'uuid',
+    'country',
+    'itemType',
+    'salesChannel',
+    'orderPriority',
+    'orderDate',
+    'region',
+    'shipDate',
+    'error',
+    'cause'
+]
+
+
+def error_record(row):
+    record = {name: str(row.get(name, "")) for name in ERROR_FIELDS[:-2]}
+    record['error'] = str(row['error-info'].get('Error', ""))
+    record['cause'] = str(row['error-info'].get('Cause', ""))
+    return record
+
+
+class ErrorSink:
+    """
+    Collects the rejected rows of a chunk and stores them together when the chunk is
+    written: in the error table with BatchWriteItem, 25 items per request with the
+    unprocessed items retried by the batch writer, and in an error file next to the
+    chunk outputs.
+    """
+
+    def __init__(self, table_name, bucket, folder, chunk_file_name, header=False):
+        self.table_name = table_name
+        self.bucket = bucket
+        self.key = "/".join([folder, ERROR_FOLDER, chunk_file_name])
+        self.header = header
+        self.records = []
+
+    @property
+    def count(self):
+        return len(self.records)
+
+    def add(self, row):
+        self.records.append(error_record(row))
+
+    def flush(self):
+        """
+        Stores the collected rows and returns the key of the error file, or None when
+        the chunk had no rejected rows.
+        """
+        if not self.records:
+            return None
+        table = clients.resource('dynamodb').Table(self.table_name)
+        # The table is keyed by uuid, so a duplicate uuid in the chunk overwrites instead
+        # of failing the batch.
+        with table.batch_writer(overwrite_by_pkeys=['uuid']) as batch:
+            for record in self.records:
+                batch.put_item(Item=record)
+        # The chunk error files have no header; the merge adds it to the combined file.
+        with s3_stream.open_text_writer(self.bucket, self.key) as error_file:
+            if self.header:
+                error_file.write(",".join(ERROR_FIELDS) + "\n")
+            writer = csv.DictWriter(error_file, ERROR_FIELDS, quoting=csv.QUOTE_ALL)
+            writer.writerows(self.records)
+        return self.key
@@ -0,0 +1,106 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+import hashlib
+import math
+import os
+import struct
+
+import reference_store
+
+# A Bloom filter of the keys of the financial table, stored with reference_store next to
+# the reference snapshots:
+#   reference-snapshots/<reference data version>/<created at>.bloom   the filter
+#   reference-snapshots/existence.json                                the current filter, written last
+# A key that is not in the filter has no financial data and needs no lookup. A key in it
+# may still have none, with the false positive rate the filter was sized for.
+LATEST = "existence.json"
+
+_MAGIC = b"BLM1"
+_HEADER = struct.Struct(">4sQIQ")
+
+
+class BloomFilter:
+    """
+    A Bloom filter over string keys with `hashes` bit positions per key, derived from one
+    BLAKE2b digest by double hashing.
+    """
+
+    def __init__(self, bits, hashes, data=None, count=0):
+        self.bits = bits
+        self.hashes = hashes
+        self.data = bytearray(data) if data is not None else bytearray((bits + 7) // 8)
+        self.count = count
+
+    @classmethod
+    def for_capacity(cls, capacity, false_positive_rate=None):
+        """
+        Returns an empty filter sized for `capacity` keys at the false positive rate of
+        EXISTENCE_INDEX_FP_RATE (default 0.01).
+        """
+        rate = false_positive_rate or float(os.environ.get('EXISTENCE_INDEX_FP_RATE', 0.01))
+        capacity = max(1, capacity)
+        bits = max(64, int(math.ceil(-capacity * math.log(rate) / math.log(2) ** 2)))
+        return cls(bits, max(1, int(round(bits / capacity * math.log(2)))))
+
+    @classmethod
+    def from_keys(cls, keys, false_positive_rate=None):
+        keys = list(keys)
+        index = cls.for_capacity(len(keys), false_positive_rate)
+        for key in keys:
+            index.add(key)
+        return index
+
+    @classmethod
+    def from_bytes(cls, body):
+        magic, bits, hashes, count = _HEADER.unpack_from(body)
+        if magic != _MAGIC:
+            raise ValueError("Not an existence index")
+        return cls(bits, hashes, body[_HEADER.size:], count)
+
+    def to_bytes(self):
+        return _HEADER.pack(_MAGIC, self.bits, self.hashes, self.count) + bytes(self.data)
+
+    def _positions(self, key):
+        digest = hashlib.blake2b(str(key).encode('utf-8'), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], 'big')
+        second = int.from_bytes(digest[8:], 'big') | 1
+        return ((first + i * second) % self.bits for i in range(self.hashes))
+
+    def add(self, key):
+        for position in self._positions(key):
+            self.data[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, key):
+        return all(self.data[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+    def expected_false_positive_rate(self):
+        return (1 - math.exp(-self.hashes * self.count / self.bits)) ** self.hashes
+
+
+def write_index(bucket, keys, reference_version=None, source=None):
+    """
+    Builds the filter of `keys`, stores it as the current existence index and returns its
+    manifest.
+    """
+    index = BloomFilter.from_keys(keys)
+    return reference_store.write(bucket, LATEST, "bloom", index.to_bytes(), reference_version,
+                                 keys=index.count, hashes=index.hashes,
+                                 expectedFalsePositiveRate=index.expected_false_positive_rate(), source=source)
+
+
+_current = reference_store.CurrentArtifact(LATEST, BloomFilter.from_bytes)
+
+
+def current_index():
+    """
+    Returns the current existence index, or None when rows have to be looked up without one.
+
+    The index is used when EXISTENCE_INDEX is "on" and a fresh index is in SNAPSHOT_BUCKET
+    (see reference_store.CurrentArtifact). Keys added to the table after the index was
+    built are not in it, so a reload of the table needs a new REFERENCE_DATA_VERSION or a
+    rebuild.
+    """
+    if os.environ.get('EXISTENCE_INDEX', 'off') != 'on':
+        return None
+    return _current.get(os.environ['SNAPSHOT_BUCKET'])
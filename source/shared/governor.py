@@ -0,0 +1,254 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+import math
+import os
+import threading
+import time
+from decimal import Decimal
+
+import clients
+
+# A semaphore over the chunk workflows of all executions in the region. Its state is one
+# item of the governor table:
+#   {"resource": "chunks", "version": n,
+#    "leases":  {<lease id>: {"file": <file id>, "weight": w, "expiresAt": t}},
+#    "waiting": {<lease id>: {"file": <file id>, "weight": w, "seenAt": t}}}
+# A slot is taken with an update conditional on the version read, so the limit holds even
+# with many acquirers. Leases expire, so a chunk workflow that never released its slot
+# only holds it for GOVERNOR_LEASE_SECONDS.
+#
+# Every acquire reads the item with a consistent read and writes it when it takes a slot
+# or refreshes its waiter entry, which waiters do at most every GOVERNOR_WAITER_SECONDS / 2.
+# Both are billed by item size (4 KB per read unit, 1 KB per write unit) and all go to one
+# partition key, so the item is a hot key of at most about 1,000 writes per second. An
+# entry is about 150 bytes; at most GOVERNOR_MAX_WAITERS waiters are registered, and stale
+# ones are removed by the next writer, so the item stays well below the 400 KB item limit.
+GOVERNOR_RESOURCE = "chunks"
+# Object metadata giving an input file a larger share of the slots, e.g. x-amz-meta-batch-weight: 3.
+WEIGHT_METADATA = "batch-weight"
+
+# Stale entries removed per update, to keep the update expression small.
+_MAX_REMOVES = 50
+
+_governor = None
+
+
+def _env_int(name, default):
+    return int(os.environ.get(name, default))
+
+
+class SlotUnavailable(Exception):
+    """
+    Raised when all slots are taken or the file is over its share; the state machine
+    retries the acquire after a delay.
+    """
+
+
+def chunk_limit():
+    return _env_int('GOVERNOR_CHUNK_LIMIT', 20)
+
+
+def lookup_share(default):
+    """
+    Returns the lookups one chunk may keep in flight, so that chunk_limit() chunks together
+    stay within GOVERNOR_LOOKUP_LIMIT. Without a lookup limit it is `default`.
+    """
+    limit = _env_int('GOVERNOR_LOOKUP_LIMIT', 0)
+    if not limit:
+        return default
+    return max(1, min(default, limit // chunk_limit()))
+
+
+def file_weight(metadata):
+    try:
+        return max(1, int(metadata.get(WEIGHT_METADATA, 1)))
+    except ValueError:
+        return 1
+
+
+def plan(state, lease_id, file_id, weight, limit, now, waiter_seconds):
+    """
+    Decides an acquire on a snapshot of the governor state. Returns (granted, live leases,
+    live waiters, expired lease ids, stale waiter ids).
+
+    A file may take a free slot unless another waiting file is below its share, where the
+    share of a file is the limit split in proportion to the weights of all files holding
+    or waiting for slots. A file alone takes every free slot.
+    """
+    leases = {key: lease for key, lease in state['leases'].items() if lease['expiresAt'] > now}
+    waiting = {key: waiter for key, waiter in state['waiting'].items()
+               if waiter['seenAt'] > now - waiter_seconds and key not in leases}
+    expired = [key for key in state['leases'] if key not in leases and key != lease_id]
+    stale = [key for key in state['waiting'] if key not in waiting and key != lease_id]
+    if lease_id in leases:
+        return True, leases, waiting, expired, stale
+    if len(leases) >= limit:
+        return False, leases, waiting, expired, stale
+
+    weights = {file_id: weight}
+    held = {}
+    for entry in list(leases.values()) + list(waiting.values()):
+        weights[entry['file']] = max(weights.get(entry['file'], 0), entry['weight'])
+    for lease in leases.values():
+        held[lease['file']] = held.get(lease['file'], 0) + 1
+    total = sum(weights.values())
+
+    def share(file):
+        return max(1, math.floor(limit * weights[file] / total))
+
+    if held.get(file_id, 0) >= share(file_id):
+        starved = {waiter['file'] for waiter in waiting.values()
+                   if waiter['file'] != file_id and held.get(waiter['file'], 0) < share(waiter['file'])}
+        if starved:
+            return False, leases, waiting, expired, stale
+    return True, leases, waiting, expired, stale
+
+
+class MemoryGovernor:
+    """
+    The governor with its state in memory, for benchmarks and local runs of the functions.
+    """
+
+    def __init__(self, limit=None, lease_seconds=None, waiter_seconds=None, max_waiters=None):
+        self.limit = limit or chunk_limit()
+        self.lease_seconds = lease_seconds or _env_int('GOVERNOR_LEASE_SECONDS', 1800)
+        self.waiter_seconds = waiter_seconds or _env_int('GOVERNOR_WAITER_SECONDS', 60)
+        self.max_waiters = max_waiters or _env_int('GOVERNOR_MAX_WAITERS', 1000)
+        self.state = {'leases': {}, 'waiting': {}}
+        self._lock = threading.Lock()
+
+    def acquire(self, lease_id, file_id, weight=1):
+        with self._lock:
+            now = time.time()
+            granted, leases, waiting, _, _ = plan(self.state, lease_id, file_id, weight, self.limit, now,
+                                                  self.waiter_seconds)
+            if granted:
+                leases[lease_id] = {'file': file_id, 'weight': weight, 'expiresAt': now + self.lease_seconds}
+                waiting.pop(lease_id, None)
+            elif lease_id in waiting or len(waiting) < self.max_waiters:
+                waiting.setdefault(lease_id, {'file': file_id, 'weight': weight})['seenAt'] = now
+            self.state = {'leases': leases, 'waiting': waiting}
+            return granted, {'inFlight': len(leases), 'queueDepth': len(waiting)}
+
+    def release(self, lease_id):
+        with self._lock:
+            self.state['leases'].pop(lease_id, None)
+            self.state['waiting'].pop(lease_id, None)
+
+
+class DynamoDBGovernor(MemoryGovernor):
+    """
+    The governor with its state in a DynamoDB table keyed by "resource", shared by all
+    executions in the region.
+    """
+
+    def __init__(self, table_name, resource=GOVERNOR_RESOURCE, max_conflicts=10, **kwargs):
+        super().__init__(**kwargs)
+        self.table = clients.resource('dynamodb').Table(table_name)
+        self.resource = resource
+        self.max_conflicts = max_conflicts
+
+    def _read(self):
+        from botocore.exceptions import ClientError
+
+        item = self.table.get_item(Key={'resource': self.resource}, ConsistentRead=True).get('Item')
+        if item is None:
+            item = {'resource': self.resource, 'version': 0, 'leases': {}, 'waiting': {}}
+            try:
+                self.table.put_item(Item=item, ConditionExpression='attribute_not_exists(#resource)',
+                                    ExpressionAttributeNames={'#resource': 'resource'})
+            except ClientError as e:
+                if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                    raise
+                return self._read()
+        # DynamoDB returns numbers as Decimal.
+        for entries in (item['leases'], item['waiting']):
+            for entry in entries.values():
+                for name in ('weight', 'expiresAt', 'seenAt'):
+                    if name in entry:
+                        entry[name] = float(entry[name])
+        return item
+
+    def acquire(self, lease_id, file_id, weight=1):
+        from botocore.exceptions import ClientError
+
+        for _ in range(self.max_conflicts):
+            item = self._read()
+            now = time.time()
+            granted, leases, waiting, expired, stale = plan(item, lease_id, file_id, weight, self.limit, now,
+                                                            self.waiter_seconds)
+            if not granted:
+                self._register_waiter(lease_id, file_id, weight, now, waiting, stale)
+                return False, {'inFlight': len(leases), 'queueDepth': len(waiting | {lease_id: None})}
+
+            names = {'#lease': lease_id}
+            removes = ['waiting.#lease']
+            for index, key in enumerate(expired[:_MAX_REMOVES]):
+                names['#e%d' % index] = key
+                removes.append('leases.#e%d' % index)
+            for index, key in enumerate(stale[:_MAX_REMOVES]):
+                names['#s%d' % index] = key
+                removes.append('waiting.#s%d' % index)
+            try:
+                self.table.update_item(
+                    Key={'resource': self.resource},
+                    UpdateExpression='SET leases.#lease = :lease, version = version + :one REMOVE ' + ', '.join(removes),
+                    ConditionExpression='version = :version',
+                    ExpressionAttributeNames=names,
+                    ExpressionAttributeValues={
+                        ':lease': {'file': file_id, 'weight': weight,
+                                   'expiresAt': Decimal(str(now + self.lease_seconds))},
+                        ':one': 1,
+                        ':version': item['version']})
+            except ClientError as e:
+                if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                    raise
+                continue
+            leases[lease_id] = None
+            waiting.pop(lease_id, None)
+            return True, {'inFlight': len(leases), 'queueDepth': len(waiting)}
+        # Lost the race every time; the caller retries like for a full semaphore.
+        return False, {'inFlight': self.limit, 'queueDepth': len(waiting)}
+
+    def _register_waiter(self, lease_id, file_id, weight, now, waiting, stale):
+        from botocore.exceptions import ClientError
+
+        # A waiter that registered recently is still counted by the next acquirers.
+        if lease_id in waiting and waiting[lease_id]['seenAt'] > now - self.waiter_seconds / 2:
+            return
+        # Registering needs no version check; it only adds to the demand the next acquirers
+        # see. Stale waiters are dropped on the way, and a full queue takes no new waiters.
+        names = {'#lease': lease_id}
+        removes = []
+        for index, key in enumerate(stale[:_MAX_REMOVES]):
+            names['#s%d' % index] = key
+            removes.append('waiting.#s%d' % index)
+        try:
+            self.table.update_item(
+                Key={'resource': self.resource},
+                UpdateExpression='SET waiting.#lease = :waiter' + (' REMOVE ' + ', '.join(removes) if removes else ''),
+                # The size is taken before the stale waiters are removed.
+                ConditionExpression='attribute_exists(waiting.#lease) OR size(waiting) < :max',
+                ExpressionAttributeNames=names,
+                ExpressionAttributeValues={':waiter': {'file': file_id, 'weight': weight, 'seenAt': Decimal(str(now))},
+                                           ':max': self.max_waiters + len(removes)})
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                raise
+
+    def release(self, lease_id):
+        self.table.update_item(
+            Key={'resource': self.resource},
+            UpdateExpression='REMOVE leases.#lease, waiting.#lease',
+            ExpressionAttributeNames={'#lease': lease_id})
+
+
+def default_governor():
+    """
+    Returns the governor of GOVERNOR_TABLE_NAME, or one in memory when no table is set.
+    """
+    global _governor
+    if _governor is None:
+        table_name = os.environ.get('GOVERNOR_TABLE_NAME')
+        _governor = DynamoDBGovernor(table_name) if table_name else MemoryGovernor()
+    return _governor
@@ -0,0 +1,169 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+import json
+import os
+import time
+from contextlib import contextmanager
+
+from aws_lambda_powertools.metrics import MetricUnit
+
+# Counters that every stage reports, even when they stay at zero, so the dashboard
+# graphs do not show gaps for stages that did not touch a given resource.
+ROWS = "Rows"
+BYTES_READ = "BytesRead"
+BYTES_WRITTEN = "BytesWritten"
+S3_REQUESTS = "S3Requests"
+DDB_CONSUMED_CAPACITY = "DynamoDBConsumedCapacity"
+
+_DEFAULT_COUNTERS = {
+    ROWS: MetricUnit.Count,
+    BYTES_READ: MetricUnit.Bytes,
+    BYTES_WRITTEN: MetricUnit.Bytes,
+    S3_REQUESTS: MetricUnit.Count,
+    DDB_CONSUMED_CAPACITY: MetricUnit.Count,
+}
+
+_active_recorder = None
+
+
+class StageRecorder:
+    """
+    Collects phase timings and row/byte/request counters for one stage invocation.
+
+    Updates are plain dictionary additions so they can sit inside per-row loops. Nothing
+    is emitted until flush(), which writes a single CloudWatch embedded metric format
+    (EMF) record with three dimension sets: (service, stage) for the dashboard,
+    (service, stage, file) for per-file totals and, when the stage handles one chunk,
+    (service, stage, file, chunk).
+    """
+
+    def __init__(self, stage, file_name, chunk=None):
+        self.stage = stage
+        self.file_name = file_name
+        self.chunk = chunk
+        self.counters = {name: 0 for name in _DEFAULT_COUNTERS}
+        self.units = dict(_DEFAULT_COUNTERS)
+        self.timings = {}
+        self._start = time.perf_counter()
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = (time.perf_counter() - start) * 1000
+            self.timings[name] = self.timings.get(name, 0.0) + elapsed
+
+    def increment(self, name, value=1, unit=MetricUnit.Count):
+        self.counters[name] = self.counters.get(name, 0) + value
+        self.units.setdefault(name, unit)
+
+    def add_rows(self, value=1):
+        self.counters[ROWS] += value
+
+    def add_bytes_read(self, value):
+        self.counters[BYTES_READ] += value
+
+    def add_bytes_written(self, value):
+        self.counters[BYTES_WRITTEN] += value
+
+    def add_s3_requests(self, value=1):
+        self.counters[S3_REQUESTS] += value
+
+    def add_consumed_capacity(self, consumed_capacity):
+        # Accepts the ConsumedCapacity element of a DynamoDB response, either a single
+        # entry or the list returned by batch operations.
+        if not consumed_capacity:
+            return
+        if isinstance(consumed_capacity, dict):
+            consumed_capacity = [consumed_capacity]
+        for entry in consumed_capacity:
+            self.counters[DDB_CONSUMED_CAPACITY] += entry.get('CapacityUnits', 0)
+
+    def totals(self):
+        elapsed = time.perf_counter() - self._start
+        totals = dict(self.counters)
+        totals["Duration"] = elapsed * 1000
+        for name, value in self.timings.items():
+            totals[name + "Duration"] = value
+        if elapsed > 0:
+            totals["RowsPerSecond"] = self.counters[ROWS] / elapsed
+            totals["BytesPerSecond"] = (self.counters[BYTES_READ] + self.counters[BYTES_WRITTEN]) / elapsed
+        return totals
+
+    def flush(self):
+        totals = self.totals()
+        print(json.dumps(self._to_emf(totals)))
+        return totals
+
+    def _to_emf(self, totals):
+        units = {"Duration": MetricUnit.Milliseconds, "RowsPerSecond": MetricUnit.CountPerSecond,
+                 "BytesPerSecond": MetricUnit.BytesPerSecond}
+        units.update({name + "Duration": MetricUnit.Milliseconds for name in self.timings})
+        units.update(self.units)
+
+        dimension_sets = [["service", "stage"], ["service", "stage", "file"]]
+        record = {
+            "service": os.environ.get('POWERTOOLS_SERVICE_NAME', 'service_undefined'),
+            "stage": self.stage,
+            "file": self.file_name,
+        }
+        if self.chunk is not None:
+            dimension_sets.append(["service", "stage", "file", "chunk"])
+            record["chunk"] = str(self.chunk)
+
+        record["_aws"] = {
+            "Timestamp": int(time.time() * 1000),
+            "CloudWatchMetrics": [
+                {
+                    "Namespace": os.environ.get('POWERTOOLS_METRICS_NAMESPACE', 'MultiRegionBatch'),
+                    "Dimensions": dimension_sets,
+                    "Metrics": [{"Name": name, "Unit": units[name].value} for name in totals],
+                }
+            ],
+        }
+        record.update(totals)
+        return record
+
+
+@contextmanager
+def stage_metrics(stage, file_name, chunk=None):
+    """
+    Records a stage invocation and flushes its metrics on exit, including when the
+    stage raises, so failed runs still show up in the latency graphs.
+    """
+    global _active_recorder
+    recorder = StageRecorder(stage, file_name, chunk)
+    _active_recorder = recorder
+    try:
+        yield recorder
+    finally:
+        _active_recorder = None
+        recorder.flush()
+
+
+def _count_request(request, **kwargs):
+    if _active_recorder is not None:
+        _active_recorder.add_s3_requests()
+
+
+def track_s3_requests(client):
+    """
+    Counts every HTTP request an S3 client sends while a stage_metrics block is active,
+    including retries and multipart parts that the caller never sees.
+    """
+    client.meta.events.register('before-send.s3', _count_request, unique_id='instrumentation-s3-requests')
+    return client
+
+
+def parse_chunk_path(file_path):
+    """
+    Returns (file, chunk) for a split part such as
+    bucket/<id>/to_process/testfile__part3__of17.csv -> ("testfile", "3").
+    """
+    name = os.path.splitext(os.path.basename(file_path))[0]
+    file_name, _, part = name.rpartition("__part")
+    if not file_name:
+        return name, None
+    return file_name, part.split("__of")[0]
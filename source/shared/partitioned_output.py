@@ -0,0 +1,104 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+import csv
+import io
+import os
+import shutil
+import tempfile
+from datetime import datetime
+
+# Rows of a partition are kept in memory up to this size and then spooled to /tmp.
+_SPOOL_SIZE = 256 * 1024
+_COPY_SIZE = 1024 * 1024
+
+
+def partition_columns():
+    """
+    Returns the columns of MERGE_PARTITION_COLUMNS ("Region" or "Region,Country"), or []
+    when the merged output is not partitioned.
+    """
+    return [column.strip() for column in os.environ.get('MERGE_PARTITION_COLUMNS', '').split(',') if column.strip()]
+
+
+# The input files write dates with four or, like assets/testfile.csv, two digit years.
+_DATE_FORMATS = ("%m/%d/%Y", "%m/%d/%y")
+
+
+def _parse_date(value):
+    for date_format in _DATE_FORMATS:
+        try:
+            return datetime.strptime(value, date_format).date()
+        except ValueError:
+            pass
+    return None
+
+
+class _Partition:
+    def __init__(self, values):
+        self.values = values
+        self.rows = 0
+        self.min_date = None
+        self.max_date = None
+        self.spool = tempfile.SpooledTemporaryFile(max_size=_SPOOL_SIZE)
+        self.text = io.TextIOWrapper(self.spool, encoding='utf-8', newline='')
+        self.writer = csv.writer(self.text, lineterminator="\n")
+
+
+class PartitionedWriter:
+    """
+    Groups the rows of a merged file by the values of the partition columns while they
+    stream through, and writes the groups one after another into the output, so each
+    partition is one contiguous byte range of the file. The index returned by close()
+    gives the range, row count and Order Date range of every partition, so a reader can
+    fetch one partition with a ranged GET instead of scanning the file.
+    """
+
+    def __init__(self, header, columns, date_column='Order Date', max_partitions=None):
+        self.header = header
+        self.columns = columns
+        self.column_indexes = [header.index(column) for column in columns]
+        self.date_index = header.index(date_column) if date_column in header else None
+        self.max_partitions = max_partitions or int(os.environ.get('MERGE_MAX_PARTITIONS', 1000))
+        self.partitions = {}
+
+    def writerow(self, row):
+        key = tuple(row[index] for index in self.column_indexes)
+        partition = self.partitions.get(key)
+        if partition is None:
+            if len(self.partitions) >= self.max_partitions:
+                raise Exception("More than %d partitions for columns %s" % (self.max_partitions, self.columns))
+            partition = self.partitions[key] = _Partition(dict(zip(self.columns, key)))
+        partition.writer.writerow(row)
+        partition.rows += 1
+        if self.date_index is not None:
+            date = _parse_date(row[self.date_index])
+            if date is not None:
+                partition.min_date = date if partition.min_date is None else min(partition.min_date, date)
+                partition.max_date = date if partition.max_date is None else max(partition.max_date, date)
+
+    def close(self, out_file):
+        """
+        Writes the header and the partitions, in the order of their column values, to the
+        binary file `out_file` and returns the index.
+        """
+        header = (",".join(self.header) + "\n").encode('utf-8')
+        out_file.write(header)
+        offset = len(header)
+        index = []
+        for key in sorted(self.partitions):
+            partition = self.partitions[key]
+            partition.text.flush()
+            length = partition.spool.tell()
+            partition.spool.seek(0)
+            shutil.copyfileobj(partition.spool, out_file, _COPY_SIZE)
+            partition.text.close()
+            index.append({
+                "values": partition.values,
+                "offset": offset,
+                "length": length,
+                "rows": partition.rows,
+                "minOrderDate": partition.min_date.isoformat() if partition.min_date else None,
+                "maxOrderDate": partition.max_date.isoformat() if partition.max_date else None
+            })
+            offset += length
+        return {"columns": self.columns, "headerLength": len(header), "partitions": index}
@@ -0,0 +1,87 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+import json
+import os
+import time
+from datetime import datetime, timedelta, timezone
+
+import clients
+import s3_stream
+
+# Artifacts built from the financial table (the snapshot, the existence index) in the
+# source bucket, so the same lifecycle rule expires the old ones:
+#   reference-snapshots/<reference data version>/<created at>.<extension>   the artifact
+#   reference-snapshots/<manifest name>                                     the current one, written last
+PREFIX = "reference-snapshots"
+
+
+def _env_int(name, default):
+    return int(os.environ.get(name, default))
+
+
+def write(bucket, manifest_name, extension, body, reference_version=None, **fields):
+    """
+    Stores `body` as the current artifact of `manifest_name` and returns its manifest,
+    which also carries `fields`.
+    """
+    reference_version = reference_version or os.environ.get('REFERENCE_DATA_VERSION', '1')
+    created_at = datetime.now(timezone.utc)
+    key = "/".join([PREFIX, reference_version, created_at.strftime("%Y%m%dT%H%M%SZ") + "." + extension])
+    clients.client('s3').put_object(Bucket=bucket, Key=key, Body=body)
+    manifest = dict({"key": key, "bytes": len(body), "referenceVersion": reference_version,
+                     "createdAt": created_at.isoformat()}, **fields)
+    clients.client('s3').put_object(Bucket=bucket, Key=PREFIX + "/" + manifest_name,
+                                    Body=json.dumps(manifest).encode('utf-8'), ContentType='application/json')
+    return manifest
+
+
+def _fresh(manifest):
+    if manifest is None or manifest['referenceVersion'] != os.environ.get('REFERENCE_DATA_VERSION', '1'):
+        return False
+    max_age = timedelta(hours=_env_int('SNAPSHOT_MAX_AGE_HOURS', 24))
+    return datetime.fromisoformat(manifest['createdAt']) >= datetime.now(timezone.utc) - max_age
+
+
+def _latest_manifest(bucket, manifest_name):
+    from botocore.exceptions import ClientError
+
+    try:
+        return json.loads(s3_stream.read_object(bucket, PREFIX + "/" + manifest_name))
+    except ClientError as e:
+        if e.response['Error']['Code'] in ('NoSuchKey', '404'):
+            return None
+        raise
+
+
+class CurrentArtifact:
+    """
+    The current artifact of `manifest_name`, parsed with `parse` and kept for the lifetime
+    of the execution environment. The manifest is checked at most every
+    SNAPSHOT_CHECK_SECONDS, and the artifact is only used while it was built for the
+    configured REFERENCE_DATA_VERSION within SNAPSHOT_MAX_AGE_HOURS.
+    """
+
+    def __init__(self, manifest_name, parse):
+        self.manifest_name = manifest_name
+        self.parse = parse
+        self._loaded = None
+
+    def get(self, bucket, load=True):
+        """
+        Returns the current artifact, or None when there is no fresh one or, with `load`
+        False, it is not loaded yet.
+        """
+        now = time.monotonic()
+        if self._loaded is None or now - self._loaded['checkedAt'] > _env_int('SNAPSHOT_CHECK_SECONDS', 60):
+            manifest = _latest_manifest(bucket, self.manifest_name)
+            if self._loaded is not None and manifest is not None and manifest['key'] == self._loaded['manifest']['key']:
+                self._loaded['checkedAt'] = now
+            else:
+                self._loaded = {'manifest': manifest, 'artifact': None, 'checkedAt': now}
+        if not _fresh(self._loaded['manifest']):
+            return None
+        if self._loaded['artifact'] is None:
+            if not load:
+                return None
+            self._loaded['artifact'] = self.parse(s3_stream.read_object(bucket, self._loaded['manifest']['key']))
+        return self._loaded['artifact']
@@ -0,0 +1,112 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+import hashlib
+import json
+import os
+from datetime import datetime, timedelta, timezone
+
+import checkpoint
+import clients
+import s3_stream
+from error_sink import ERROR_FOLDER
+from instrumentation import parse_chunk_path
+
+# Results of processed chunks, addressed by the content of the chunk and the version of the
+# reference data it was enriched with:
+#   result-cache/<cache key>/output.csv    the written output chunk
+#   result-cache/<cache key>/errors.csv    its rejected rows, when there were any
+#   result-cache/<cache key>/result.json   row counts and digest, written last
+# An entry only counts once result.json exists. The source bucket expires the prefix with a
+# lifecycle rule; entries older than RESULT_CACHE_TTL_DAYS are ignored before that.
+CACHE_PREFIX = "result-cache"
+# Part of every cache key, so a change to the output format invalidates the old entries.
+CACHE_FORMAT = "1"
+RESULT = "result.json"
+
+
+def _ttl_days():
+    return int(os.environ.get('RESULT_CACHE_TTL_DAYS', 30))
+
+
+def enabled():
+    return _ttl_days() > 0
+
+
+def content_hasher():
+    return hashlib.sha256()
+
+
+def update_hash(hasher, row):
+    # Unit and record separators, so different field splits of the same text hash differently.
+    hasher.update(("\x1f".join(row) + "\x1e").encode('utf-8'))
+
+
+def cache_key(content_hash, reference_version=None):
+    reference_version = reference_version or os.environ.get('REFERENCE_DATA_VERSION', '1')
+    return hashlib.sha256("\n".join([CACHE_FORMAT, reference_version, content_hash]).encode('utf-8')).hexdigest()
+
+
+def _entry(content_hash):
+    return "/".join([CACHE_PREFIX, cache_key(content_hash)])
+
+
+def _error_key(chunk_key):
+    # <file id>/errors/<chunk file name>, where write-output-chunk puts the chunk's errors.
+    return "/".join([chunk_key.split("/")[0], ERROR_FOLDER, os.path.basename(chunk_key)])
+
+
+def lookup(bucket, content_hash):
+    """
+    Returns the cached result record for the chunk content, or None when there is no
+    entry or it has expired.
+    """
+    from botocore.exceptions import ClientError
+
+    try:
+        result = json.loads(s3_stream.read_object(bucket, _entry(content_hash) + "/" + RESULT))
+    except ClientError as e:
+        if e.response['Error']['Code'] in ('NoSuchKey', '404'):
+            return None
+        raise
+    if datetime.fromisoformat(result['cachedAt']) < datetime.now(timezone.utc) - timedelta(days=_ttl_days()):
+        return None
+    return result
+
+
+def restore(bucket, chunk_path, content_hash):
+    """
+    Copies the cached output and error file of the chunk content into the folder of the
+    chunk at `chunk_path` ("bucket/key" of its part) and marks the chunk complete, as
+    write-output-chunk would have. Returns False on a cache miss.
+    """
+    result = lookup(bucket, content_hash)
+    if result is None:
+        return False
+    entry = _entry(content_hash)
+    part_key = s3_stream.split_path(chunk_path)[1]
+    output_key = checkpoint.output_key(part_key)
+    s3_stream.copy_object(bucket, entry + "/output.csv", bucket, output_key)
+    error_file = None
+    if result['errors']:
+        error_file = _error_key(output_key)
+        s3_stream.copy_object(bucket, entry + "/errors.csv", bucket, error_file)
+    checkpoint.mark_chunk_complete(bucket, output_key.split("/")[0], parse_chunk_path(part_key)[1],
+                                   {"output": output_key, "rows": result['rows'], "sha256": result['sha256'],
+                                    "errors": result['errors'], "errorFile": error_file, "cached": True})
+    return True
+
+
+def store(bucket, content_hash, record):
+    """
+    Copies a written chunk (its checkpoint record) into the cache. The result record is
+    written after the objects, so a partly stored entry is never used.
+    """
+    entry = _entry(content_hash)
+    s3_stream.copy_object(bucket, record['output'], bucket, entry + "/output.csv")
+    if record.get('errorFile'):
+        s3_stream.copy_object(bucket, record['errorFile'], bucket, entry + "/errors.csv")
+    result = {"rows": record['rows'], "sha256": record['sha256'], "errors": record['errors'],
+              "contentHash": content_hash, "referenceVersion": os.environ.get('REFERENCE_DATA_VERSION', '1'),
+              "cachedAt": datetime.now(timezone.utc).isoformat()}
+    clients.client('s3').put_object(Bucket=bucket, Key=entry + "/" + RESULT, Body=json.dumps(result).encode('utf-8'),
+                                    ContentType='application/json')
@@ -1,5 +1,6 @@
 # Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
 # SPDX-License-Identifier: MIT-0
+# Schema of a row of the input file, used by every function that validates rows.
 INPUT = {
     "$schema": "http://json-schema.org/draft-07/schema",
     "$id": "http://example.com/example.json",
@@ -0,0 +1,268 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+import io
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import clients
+
+_MiB = 1024 * 1024
+# S3 rejects multipart parts smaller than 5 MiB, except for the last one.
+_MIN_PART_SIZE = 5 * _MiB
+
+
+def _env_int(name, default):
+    return int(os.environ.get(name, default))
+
+
+def split_path(path):
+    """
+    Splits the "bucket/key" form used in the state machine payloads into (bucket, key).
+    """
+    bucket, _, key = path.partition("/")
+    return bucket, key
+
+
+def prefetch(function, items, depth):
+    """
+    Yields function(item) for every item in order while keeping up to `depth` calls
+    running ahead of the consumer on a thread pool.
+    """
+    items = iter(items)
+    with ThreadPoolExecutor(max_workers=max(1, depth)) as executor:
+        pending = deque()
+        for item in items:
+            pending.append(executor.submit(function, item))
+            if len(pending) >= depth:
+                break
+        while pending:
+            result = pending.popleft().result()
+            for item in items:
+                pending.append(executor.submit(function, item))
+                break
+            yield result
+
+
+class RangedReader(io.RawIOBase):
+    """
+    Reads an S3 object as a sequence of ranged GETs of `part_size` bytes, keeping up to
+    `read_ahead` ranges in flight so the network stays busy while the caller parses the
+    current range.
+    """
+
+    def __init__(self, bucket, key, size=None, part_size=None, read_ahead=None, s3_client=None):
+        super().__init__()
+        self.bucket = bucket
+        self.key = key
+        self.part_size = part_size or _env_int('S3_READ_PART_SIZE', 8 * _MiB)
+        self.read_ahead = read_ahead or _env_int('S3_READ_AHEAD', 4)
+        self._client = s3_client or clients.client('s3')
+        if size is None:
+            size = self._client.head_object(Bucket=bucket, Key=key)['ContentLength']
+        self.size = size
+        self.bytes_read = 0
+        self._ranges = prefetch(self._get_range, range(0, size, self.part_size), self.read_ahead)
+        self._current = memoryview(b"")
+
+    def _get_range(self, start):
+        end = min(start + self.part_size, self.size) - 1
+        response = self._client.get_object(Bucket=self.bucket, Key=self.key, Range="bytes=%d-%d" % (start, end))
+        return response['Body'].read()
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        if not self._current:
+            block = next(self._ranges, None)
+            if block is None:
+                return 0
+            self._current = memoryview(block)
+        count = min(len(buffer), len(self._current))
+        buffer[:count] = self._current[:count]
+        self._current = self._current[count:]
+        self.bytes_read += count
+        return count
+
+    def close(self):
+        if not self.closed:
+            self._ranges.close()
+        super().close()
+
+
+class MultipartWriter(io.RawIOBase):
+    """
+    Buffers writes into `part_size` parts and uploads them with up to `concurrency` parts
+    in flight. Objects that fit in a single part are written with one PutObject call, so
+    small chunk files do not pay for the multipart round trips.
+    """
+
+    def __init__(self, bucket, key, part_size=None, concurrency=None, s3_client=None, **put_args):
+        super().__init__()
+        self.bucket = bucket
+        self.key = key
+        self.part_size = max(part_size or _env_int('S3_WRITE_PART_SIZE', 8 * _MiB), _MIN_PART_SIZE)
+        self.concurrency = concurrency or _env_int('S3_WRITE_CONCURRENCY', 4)
+        self.put_args = put_args
+        self.bytes_written = 0
+        self._client = s3_client or clients.client('s3')
+        self._buffer = bytearray()
+        self._upload_id = None
+        self._executor = None
+        self._parts = []
+        self.failed = False
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._buffer += data
+        self.bytes_written += len(data)
+        while len(self._buffer) >= self.part_size:
+            self._submit_part(bytes(self._buffer[:self.part_size]))
+            del self._buffer[:self.part_size]
+        return len(data)
+
+    def _submit_part(self, body):
+        if self._upload_id is None:
+            self._upload_id = self._client.create_multipart_upload(Bucket=self.bucket, Key=self.key,
+                                                                   **self.put_args)['UploadId']
+            self._executor = ThreadPoolExecutor(max_workers=self.concurrency)
+        # Bound the parts held in memory to the ones being uploaded.
+        if len(self._parts) >= self.concurrency:
+            self._parts[-self.concurrency].result()
+        part_number = len(self._parts) + 1
+        self._parts.append(self._executor.submit(self._upload_part, part_number, body))
+
+    def _upload_part(self, part_number, body):
+        response = self._client.upload_part(Bucket=self.bucket, Key=self.key, UploadId=self._upload_id,
+                                            PartNumber=part_number, Body=body)
+        return {'PartNumber': part_number, 'ETag': response['ETag']}
+
+    def close(self):
+        """
+        Publishes the object. A writer that failed before it was closed must be aborted
+        instead, so no partial object is published.
+        """
+        if self.closed:
+            return
+        try:
+            if self._upload_id is None:
+                self._client.put_object(Bucket=self.bucket, Key=self.key, Body=bytes(self._buffer), **self.put_args)
+            else:
+                if self._buffer:
+                    self._submit_part(bytes(self._buffer))
+                parts = [part.result() for part in self._parts]
+                self._client.complete_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self._upload_id,
+                                                       MultipartUpload={'Parts': parts})
+        except Exception:
+            self.abort()
+            raise
+        self._release()
+
+    def abort(self):
+        """
+        Discards the buffered data and aborts the multipart upload, so nothing is published.
+        """
+        if self.closed:
+            return
+        self.failed = True
+        try:
+            if self._executor is not None:
+                # Parts still uploading would otherwise outlive the aborted upload.
+                self._executor.shutdown(wait=True)
+            if self._upload_id is not None:
+                self._client.abort_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self._upload_id)
+                self._upload_id = None
+        finally:
+            self._release()
+
+    def _release(self):
+        self._buffer = bytearray()
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+        super().close()
+
+    def __del__(self):
+        # IOBase.__del__ closes, and so would publish, a writer dropped on an error path.
+        if not self.closed:
+            self.abort()
+
+
+class TextWriter(io.TextIOWrapper):
+    """
+    A text stream over a MultipartWriter. Leaving its `with` block with an exception, or
+    dropping it without closing it, aborts the upload instead of publishing what was
+    written so far.
+    """
+
+    def __init__(self, raw, encoding='utf-8'):
+        self.raw = raw
+        super().__init__(io.BufferedWriter(raw, buffer_size=256 * 1024), encoding=encoding, newline='')
+
+    def abort(self):
+        # Once the raw writer is closed, closing the buffers no longer flushes them.
+        self.raw.abort()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None:
+            self.abort()
+        else:
+            self.close()
+
+    def __del__(self):
+        if not self.closed:
+            self.abort()
+
+
+def open_text_reader(bucket, key, size=None, encoding='utf-8-sig', **reader_args):
+    """
+    Returns a buffered text stream over the object, suitable for csv.reader.
+    """
+    raw = RangedReader(bucket, key, size=size, **reader_args)
+    return io.TextIOWrapper(io.BufferedReader(raw, buffer_size=256 * 1024), encoding=encoding, newline='')
+
+
+def open_text_writer(bucket, key, encoding='utf-8', **writer_args):
+    """
+    Returns a TextWriter that uploads to the object when closed, suitable for csv.writer.
+    Callers that do not use it in a `with` block abort it when they fail.
+    """
+    return TextWriter(MultipartWriter(bucket, key, **writer_args), encoding=encoding)
+
+
+def copy_object(source_bucket, source_key, bucket, key):
+    # The managed copy switches to a parallel multipart copy for large objects.
+    clients.client('s3').copy({'Bucket': source_bucket, 'Key': source_key}, bucket, key)
+
+
+def delete_object(bucket, key):
+    clients.client('s3').delete_object(Bucket=bucket, Key=key)
+
+
+def touch(bucket, key):
+    clients.client('s3').put_object(Bucket=bucket, Key=key, Body=b"")
+
+
+def exists(bucket, key):
+    from botocore.exceptions import ClientError
+
+    try:
+        clients.client('s3').head_object(Bucket=bucket, Key=key)
+    except ClientError as e:
+        if e.response['Error']['Code'] in ('NoSuchKey', '404'):
+            return False
+        raise
+    return True
+
+
+def read_object(bucket, key):
+    return clients.client('s3').get_object(Bucket=bucket, Key=key)['Body'].read()
+
+
+def list_keys(bucket, prefix):
+    paginator = clients.client('s3').get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
+        for item in page.get('Contents', []):
+            yield item['Key']
@@ -0,0 +1,157 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+import io
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+import clients
+import reference_store
+
+# Columnar snapshots of the financial table, stored with reference_store:
+#   reference-snapshots/<reference data version>/<created at>.npz   sorted keys and one array per column
+#   reference-snapshots/latest.json                                 the current snapshot, written last
+LATEST = "latest.json"
+
+
+def _env_int(name, default):
+    return int(os.environ.get(name, default))
+
+
+class SnapshotIndex:
+    """
+    The financial table in memory: the keys sorted in one NumPy byte-string array and
+    every attribute in an array in the same order. Keys are looked up for a whole chunk at
+    once with a vectorized binary search.
+    """
+
+    def __init__(self, keys, columns, key_name='uuid'):
+        self.keys = keys
+        self.columns = columns
+        self.key_name = key_name
+
+    def __len__(self):
+        return len(self.keys)
+
+    @classmethod
+    def from_rows(cls, rows, key_name='uuid'):
+        rows = list(rows)
+        names = sorted({name for row in rows for name in row if name != key_name})
+        keys = np.array([str(row[key_name]).encode('utf-8') for row in rows], dtype=np.bytes_)
+        # A stable sort keeps the last of duplicate keys last, and that one is used, as a
+        # later put of the same key would have overwritten the earlier one.
+        order = np.argsort(keys, kind='stable')
+        keys = keys[order]
+        last = np.append(keys[1:] != keys[:-1], True) if len(keys) else np.array([], dtype=bool)
+        columns = {name: np.array([str(row.get(name, "")).encode('utf-8') for row in rows], dtype=np.bytes_)[order][last]
+                   for name in names}
+        return cls(keys[last], columns, key_name)
+
+    @classmethod
+    def from_bytes(cls, body):
+        with np.load(io.BytesIO(body), allow_pickle=False) as arrays:
+            key_name = str(arrays['_key_name'])
+            columns = {name: arrays[name] for name in arrays.files if name not in ('_keys', '_key_name')}
+            return cls(arrays['_keys'], columns, key_name)
+
+    def to_bytes(self):
+        buffer = io.BytesIO()
+        np.savez_compressed(buffer, _keys=self.keys, _key_name=np.array(self.key_name), **self.columns)
+        return buffer.getvalue()
+
+    def lookup(self, keys):
+        """
+        Returns the positions of `keys` in the index and a mask of the keys that were found.
+        """
+        wanted = np.array([key.encode('utf-8') for key in keys], dtype=np.bytes_)
+        if not len(self.keys):
+            return np.zeros(len(wanted), dtype=np.int64), np.zeros(len(wanted), dtype=bool)
+        positions = np.minimum(np.searchsorted(self.keys, wanted), len(self.keys) - 1)
+        return positions, self.keys[positions] == wanted
+
+    def items(self, keys):
+        positions, found = self.lookup(keys)
+        hits = positions[found]
+        columns = {name: np.char.decode(values[hits], 'utf-8').tolist() for name, values in self.columns.items()}
+        found_keys = [key for key, hit in zip(keys, found.tolist()) if hit]
+        return {key: dict({name: values[i] for name, values in columns.items()}, **{self.key_name: key})
+                for i, key in enumerate(found_keys)}
+
+
+class SnapshotFetcher:
+    """
+    Enriches from a snapshot, with the same interface as the point lookup fetchers. Keys
+    that are not in the snapshot are looked up with `fallback`, so rows added to the table
+    after the snapshot was taken are still enriched.
+    """
+
+    batch_size = 10000
+
+    def __init__(self, index, fallback):
+        self.index = index
+        self.fallback = fallback
+
+    def fetch(self, keys):
+        items = self.index.items(keys)
+        misses = [key for key in keys if key not in items]
+        unprocessed = []
+        consumed = 0
+        for start in range(0, len(misses), self.fallback.batch_size):
+            found, retry, capacity = self.fallback.fetch(misses[start:start + self.fallback.batch_size])
+            items.update(found)
+            unprocessed.extend(retry)
+            consumed += capacity
+        return items, unprocessed, consumed
+
+
+def write_snapshot(bucket, index, reference_version=None, source=None):
+    """
+    Stores the index as the current snapshot and returns its manifest.
+    """
+    return reference_store.write(bucket, LATEST, "npz", index.to_bytes(), reference_version,
+                                 rows=len(index), source=source)
+
+
+def scan_table(table_name, segments=None):
+    """
+    Returns all items of the table as dicts of strings, scanning `segments` segments in
+    parallel.
+    """
+    segments = segments or _env_int('SNAPSHOT_SCAN_SEGMENTS', 4)
+    table = clients.resource('dynamodb').Table(table_name)
+
+    def scan(segment):
+        items = []
+        kwargs = {'Segment': segment, 'TotalSegments': segments}
+        while True:
+            response = table.scan(**kwargs)
+            items.extend({name: str(value) for name, value in item.items()} for item in response['Items'])
+            if 'LastEvaluatedKey' not in response:
+                return items
+            kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+    with ThreadPoolExecutor(max_workers=segments) as executor:
+        return [item for items in executor.map(scan, range(segments)) for item in items]
+
+
+_current = reference_store.CurrentArtifact(LATEST, SnapshotIndex.from_bytes)
+
+
+def select_fetcher(row_count, fallback):
+    """
+    Returns (fetcher, True) to join against the snapshot, or (fallback, False) for point
+    lookups.
+
+    The snapshot is used when ENRICHMENT_SNAPSHOT is "auto", the current snapshot in
+    SNAPSHOT_BUCKET was taken for the configured REFERENCE_DATA_VERSION within
+    SNAPSHOT_MAX_AGE_HOURS, and either it is already loaded in this execution environment
+    or the batch has at least SNAPSHOT_MIN_ROWS rows to pay for loading it. The current
+    snapshot is checked at most every SNAPSHOT_CHECK_SECONDS.
+    """
+    if os.environ.get('ENRICHMENT_SNAPSHOT', 'off') != 'auto':
+        return fallback, False
+    index = _current.get(os.environ['SNAPSHOT_BUCKET'], load=row_count >= _env_int('SNAPSHOT_MIN_ROWS', 5000))
+    if index is None:
+        return fallback, False
+    return SnapshotFetcher(index, fallback), True
@@ -1,114 +1,256 @@
 # Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
 # SPDX-License-Identifier: MIT-0
 import os
-import uuid
+from concurrent.futures import ThreadPoolExecutor
 
-import s3fs
 from aws_lambda_powertools import Logger, Tracer, Metrics
 from aws_lambda_powertools.metrics import MetricUnit
 
+import checkpoint
+import clients
+import result_cache
+import row_schema
+import s3_stream
+from audit import AuditTrail
+from error_sink import ErrorSink
+from instrumentation import stage_metrics, track_s3_requests
+
 metrics = Metrics()
 tracer = Tracer()
 logger = Logger()
-# S3 bucket info
-s3 = s3fs.S3FileSystem(anon=False)
+
+# Field names of the columns, as the read function maps them for the chunk processor.
+header = [
+    'uuid',
+    'country',
+    'itemType',
+    'salesChannel',
+    'orderPriority',
+    'orderDate',
+    'region',
+    'shipDate'
+]
+
+_validate_row = None
 
 
 @metrics.log_metrics(capture_cold_start_metric=False)
-@logger.inject_lambda_context(log_event=True, clear_state=True)
+@logger.inject_lambda_context(clear_state=True)
 @tracer.capture_lambda_handler
 def lambda_handler(event, context):
     input_archive_folder = event['inputArchiveFolder']
-    to_process_folder = str(uuid.uuid4()) + "/" + "to_process"
     file_row_limit = event['fileChunkSize']
     file_delimiter = event['fileDelimiter']
-    output_path = to_process_folder.replace("to_process", "output")
 
     record = event['Records']
 
     bucket = record['s3']['bucket']['name']
     key = record['s3']['object']['key']
     logger.append_keys(s3_object_key=key)
+    file_id = event.get('fileId') or checkpoint.file_id(key, record['s3']['object'].get('eTag'))
+    to_process_folder = file_id + "/" + "to_process"
+    output_path = to_process_folder.replace("to_process", "output")
     create_start_indicator(bucket, output_path)
     input_file = os.path.join(bucket, key)
-    archive_path = os.path.join(bucket, input_archive_folder, os.path.basename(key))
-    folder = os.path.split(key)[0]
-    s3_url = os.path.join(bucket, folder)
+    archive_key = os.path.join(input_archive_folder, os.path.basename(key))
     output_file_template = os.path.splitext(os.path.basename(key))[0] + "__part"
     output_path = os.path.join(bucket, to_process_folder)
+    size = record['s3']['object'].get('size')
 
-    # Number of files to be created
-    num_files = file_count(s3.open(input_file, 'r'), file_delimiter, file_row_limit)
-    # Split the input file into several files, each with the number of records mentioned in the fileChunkSize parameter.
-    splitFileNames = split(input_file,
-                           s3.open(input_file, 'r'),
-                           file_delimiter,
-                           file_row_limit,
-                           output_file_template,
-                           output_path, True,
-                           num_files)
-    # Archive the input file.
-    archive(input_file, archive_path)
+    track_s3_requests(clients.client('s3'))
+    audit = AuditTrail("split", key)
+    validator = None
+    if os.environ.get('SPLIT_VALIDATION', 'off') == 'inline':
+        # The merge adds the file's rejected rows to those of its chunks.
+        validator = InlineValidator(ErrorSink(os.environ['ERROR_TABLE_NAME'], bucket, file_id,
+                                              "split/" + os.path.basename(key)))
+    with stage_metrics("split", key) as recorder:
+        # A file that was split before keeps its parts, so only the chunks without a
+        # completion record are processed again. This includes parts and chunks that
+        # were replicated from the other region before a failover.
+        with recorder.phase("Checkpoint"):
+            manifest, completed = checkpoint.resume_state(bucket, file_id)
+        if manifest is None:
+            # Number of files to be created
+            with recorder.phase("Count"), s3_stream.open_text_reader(bucket, key, size=size) as in_file:
+                num_files = file_count(in_file, file_delimiter, file_row_limit, validator)
+                recorder.add_bytes_read(in_file.buffer.raw.bytes_read)
+            # Split the input file into several files, each with the number of records mentioned in the fileChunkSize parameter.
+            with recorder.phase("Split"), s3_stream.open_text_reader(bucket, key, size=size) as in_file:
+                splitFileNames, contentHashes = split(input_file,
+                                       in_file,
+                                       file_delimiter,
+                                       file_row_limit,
+                                       output_file_template,
+                                       output_path, True,
+                                       num_files,
+                                       recorder,
+                                       audit,
+                                       validator.rejected if validator else ())
+                recorder.add_bytes_read(in_file.buffer.raw.bytes_read)
+            rejected_rows = 0
+            error_file = None
+            if validator:
+                with recorder.phase("Errors"):
+                    error_file = validator.errors.flush()
+                rejected_rows = validator.errors.count
+                recorder.increment("ErrorRows", rejected_rows)
+            with recorder.phase("Checkpoint"):
+                # Keys without the bucket name, so the manifest stays valid in the replica bucket.
+                checkpoint.write_split_manifest(bucket, file_id, {
+                    "key": key, "size": size, "rows": audit.count,
+                    "parts": [s3_stream.split_path(path)[1] for path in splitFileNames],
+                    "hashes": contentHashes, "errors": rejected_rows, "errorFile": error_file})
+        else:
+            rejected_rows = manifest.get('errors', 0)
+            splitFileNames = [bucket + "/" + part_key for part_key in manifest['parts']]
+            # Manifests written before the result cache have no content hashes.
+            contentHashes = manifest.get('hashes') or [None] * len(splitFileNames)
+        pendingFileNames = checkpoint.pending_parts(splitFileNames, completed)
+        recorder.increment("SkippedChunks", len(splitFileNames) - len(pendingFileNames))
+        # The chunk processor looks up the result cache by the content hash of its part.
+        content_hash = dict(zip(splitFileNames, contentHashes))
+        pendingChunks = [{"FilePath": path, "ContentHash": content_hash[path]} for path in pendingFileNames]
+        # Archive the input file.
+        with recorder.phase("Archive"):
+            archive(bucket, key, archive_key)
+    if manifest is None:
+        audit.log(logger)
+        audit.write_manifest(clients.client('s3'), bucket, os.path.join(file_id, os.path.basename(key)))
+    else:
+        logger.info({"Resuming file": key, "chunks": len(splitFileNames), "completed chunks": len(completed)})
 
     response = {"bucket": bucket, "key": key, "splitFileNames": splitFileNames,
-                "toProcessFolder": to_process_folder}
+                "pendingChunks": pendingChunks, "toProcessFolder": to_process_folder,
+                "weight": event.get('weight', 1), "rejectedRows": rejected_rows}
     metrics.add_metric(name="InputFilesSplit", unit=MetricUnit.Count, value=1)
     logger.info(response)
     return response
 
 
+class InlineValidator:
+    """
+    Validates the rows of the input file against the schema of the validate-data function
+    while they are counted. Rejected rows are collected in `errors` and their positions in
+    `rejected`, so the split leaves them out of the parts and the chunk processor never
+    sees them.
+    """
+
+    def __init__(self, errors):
+        import fastjsonschema
+
+        global _validate_row
+        # Compiled on first use, so the split does not pay for it while validation is off.
+        if _validate_row is None:
+            _validate_row = fastjsonschema.compile(row_schema.INPUT)
+        self.invalid = fastjsonschema.JsonSchemaValueException
+        self.errors = errors
+        self.rejected = set()
+
+    def check(self, index, row):
+        """
+        Returns True when the row at `index` (counted without the header) is valid.
+        """
+        record = {header[i]: row[i] for i in range(min(len(header), len(row)))}
+        try:
+            _validate_row(record)
+        except self.invalid as e:
+            record['error-info'] = {"Error": type(e).__name__, "Cause": str(e.message)}
+            self.errors.add(record)
+            self.rejected.add(index)
+            return False
+        return True
+
+
 # Determine the number of files that this Lambda function will create.
-def file_count(file_handler, delimiter, row_limit):
+def file_count(file_handler, delimiter, row_limit, validator=None):
     import csv
     reader = csv.reader(file_handler, delimiter=delimiter)
     # Figure out the number of files this function will generate.
-    row_count = sum(1 for row in reader) - 1
+    if validator is None:
+        row_count = sum(1 for row in reader) - 1
+    else:
+        # Only the valid rows go into the parts.
+        next(reader, None)
+        row_count = sum(validator.check(index, row) for index, row in enumerate(reader))
     # If there's a remainder, always round up.
     file_count = int(row_count // row_limit) + (row_count % row_limit > 0)
     return file_count
 
 
 # Split the input into several smaller files.
-def split(input_file, filehandler, delimiter, row_limit, output_name_template, output_path, keep_headers, num_files):
+def split(input_file, filehandler, delimiter, row_limit, output_name_template, output_path, keep_headers, num_files,
+          recorder, audit, rejected=()):
     import csv
     reader = csv.reader(filehandler, delimiter=delimiter)
     split_file_path = []
-    data = []
-    current_piece = 1
-    current_out_path = os.path.join(
-        output_path,
-        output_name_template + str(current_piece) + "__of" + str(num_files) + ".csv"
-    )
-    split_file_path.append(current_out_path)
-    current_out_writer = csv.writer(s3.open(current_out_path, 'w'), delimiter=delimiter, quoting=csv.QUOTE_ALL)
-    current_limit = row_limit
-    if keep_headers:
-        headers = next(reader)
-        current_out_writer.writerow(headers)
-    for i, row in enumerate(reader):
-        if i + 1 > current_limit:
-            current_piece += 1
-            current_limit = row_limit * current_piece
-            current_out_path = os.path.join(
-                output_path,
-                output_name_template + str(current_piece) + "__of" + str(num_files) + ".csv"
-            )
-            split_file_path.append(current_out_path)
-            current_out_writer = csv.writer(s3.open(current_out_path, 'w'), delimiter=delimiter, quoting=csv.QUOTE_ALL)
+    content_hashes = []
+    # Finished parts are uploaded in the background while the next part is being filled.
+    uploads = []
+    with ThreadPoolExecutor(max_workers=int(os.environ.get('S3_WRITE_CONCURRENCY', 4))) as executor:
+        current_piece = 1
+        current_out_path = os.path.join(
+            output_path,
+            output_name_template + str(current_piece) + "__of" + str(num_files) + ".csv"
+        )
+        split_file_path.append(current_out_path)
+        current_out_file = s3_stream.open_text_writer(*s3_stream.split_path(current_out_path))
+        current_out_writer = csv.writer(current_out_file, delimiter=delimiter, quoting=csv.QUOTE_ALL)
+        current_hash = result_cache.content_hasher()
+        current_limit = row_limit
+        # Parts already handed to an upload are complete; the part being filled is aborted
+        # when the split fails, so no truncated part is published.
+        try:
             if keep_headers:
+                headers = next(reader)
                 current_out_writer.writerow(headers)
-        current_out_writer.writerow(row)
-        data.append(row[0])
-    logger.info("Data", input_file=input_file, data=data)
-    return split_file_path
+                result_cache.update_hash(current_hash, headers)
+            written = 0
+            for i, row in enumerate(reader):
+                if i in rejected:
+                    continue
+                if written + 1 > current_limit:
+                    uploads.append(executor.submit(close_part, current_out_file))
+                    content_hashes.append(current_hash.hexdigest())
+                    current_piece += 1
+                    current_limit = row_limit * current_piece
+                    current_out_path = os.path.join(
+                        output_path,
+                        output_name_template + str(current_piece) + "__of" + str(num_files) + ".csv"
+                    )
+                    split_file_path.append(current_out_path)
+                    current_out_file = s3_stream.open_text_writer(*s3_stream.split_path(current_out_path))
+                    current_out_writer = csv.writer(current_out_file, delimiter=delimiter, quoting=csv.QUOTE_ALL)
+                    current_hash = result_cache.content_hasher()
+                    if keep_headers:
+                        current_out_writer.writerow(headers)
+                        result_cache.update_hash(current_hash, headers)
+                current_out_writer.writerow(row)
+                result_cache.update_hash(current_hash, row)
+                audit.add(row[0])
+                written += 1
+        except Exception:
+            current_out_file.abort()
+            raise
+        uploads.append(executor.submit(close_part, current_out_file))
+        content_hashes.append(current_hash.hexdigest())
+    for upload in uploads:
+        recorder.add_bytes_written(upload.result())
+    recorder.add_rows(audit.count)
+    return split_file_path, content_hashes
+
+
+def close_part(out_file):
+    out_file.close()
+    return out_file.buffer.raw.bytes_written
 
 
 @tracer.capture_method
 # Move the original input file into an archive folder.
-def archive(input_file, archive_path):
-    s3.copy(input_file, archive_path)
-    s3.rm(input_file)
+def archive(bucket, key, archive_key):
+    s3_stream.copy_object(bucket, key, bucket, archive_key)
+    s3_stream.delete_object(bucket, key)
 
 
 def create_start_indicator(bucket, folder_name):
-    response = s3.touch(bucket + "/" + folder_name + "/_started")
+    s3_stream.touch(bucket, folder_name + "/_started")
@@ -1,17 +1,22 @@
 # Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
 # SPDX-License-Identifier: MIT-0
 import csv
-import boto3
+import os
 
-import json
-from io import StringIO
 from aws_lambda_powertools import Logger, Tracer, Metrics
 from aws_lambda_powertools.metrics import MetricUnit
 
+import checkpoint
+import clients
+import result_cache
+import s3_stream
+from audit import AuditTrail
+from error_sink import ErrorSink
+from instrumentation import parse_chunk_path, stage_metrics, track_s3_requests
+
 metrics = Metrics()
 tracer = Tracer()
 logger = Logger()
-s3_client = boto3.client('s3')
 
 header = [
     'uuid',
@@ -32,32 +37,62 @@ header = [
 ]
 
 @metrics.log_metrics(capture_cold_start_metric=False)
-@logger.inject_lambda_context(log_event=True, clear_state=True)
+@logger.inject_lambda_context(clear_state=True)
 @tracer.capture_lambda_handler
 def lambda_handler(event, context):
     dataset = event['enrichedData']
     input_file_key = event['FilePath']
-    output_file_key = input_file_key.replace("to_process", "output")
+    output_file_key = checkpoint.output_key(input_file_key)
     bucket_info = get_bucket_info(output_file_key)
     logger.info(bucket_info)
 
-    out_file = StringIO()
-    file_writer = csv.writer(out_file, quoting=csv.QUOTE_ALL)
-
-    for data in dataset:
-        if 'error-info' in data:
-            continue
-        data_list = convert_to_list(data)
-        file_writer.writerow(data_list)
-
-    response = s3_client.put_object(Bucket=bucket_info['bucket'],
-                                    Key=bucket_info['key'],
-                                    Body=out_file.getvalue())
-
-    if response['ResponseMetadata']['HTTPStatusCode'] != 200:
-        message = 'Writing chunk to S3 failed' + json.dumps(response, indent=2)
-        logger.exception(message)
-        raise Exception(message)
+    s3_client = track_s3_requests(clients.client('s3'))
+    file_name, chunk = parse_chunk_path(input_file_key)
+    audit = AuditTrail("write-output-chunk", input_file_key)
+    folder = bucket_info['key'].split("/")[0]
+    errors = ErrorSink(os.environ['ERROR_TABLE_NAME'], bucket_info['bucket'], folder,
+                       os.path.basename(bucket_info['key']))
+    with stage_metrics("write-output-chunk", file_name, chunk) as recorder:
+        # A row that fails to serialize aborts the upload, so no truncated chunk is published.
+        with s3_stream.open_text_writer(bucket_info['bucket'], bucket_info['key']) as out_file:
+            file_writer = csv.writer(out_file, quoting=csv.QUOTE_ALL)
+
+            with recorder.phase("Serialize"):
+                for data in dataset:
+                    if 'error-info' in data:
+                        errors.add(data)
+                        continue
+                    data_list = convert_to_list(data)
+                    file_writer.writerow(data_list)
+                    audit.add(data['uuid'])
+                    recorder.add_rows()
+
+            # Parts that filled up were uploaded while serializing; closing uploads the rest.
+            with recorder.phase("Write"):
+                try:
+                    out_file.close()
+                except Exception:
+                    logger.exception('Writing chunk to S3 failed')
+                    raise
+        recorder.add_bytes_written(out_file.buffer.raw.bytes_written)
+
+        with recorder.phase("Errors"):
+            error_file = errors.flush()
+        recorder.increment("ErrorRows", errors.count)
+    audit.log(logger)
+    audit.write_manifest(s3_client, bucket_info['bucket'], bucket_info['key'])
+    # The completion record is written last, so a chunk only counts as done once its
+    # output exists and a retried or replayed file skips it.
+    record = {"output": bucket_info['key'], "rows": audit.count, "sha256": audit.summary()['sha256'],
+              "errors": errors.count, "errorFile": error_file}
+    checkpoint.mark_chunk_complete(bucket_info['bucket'], folder, chunk, record)
+
+    if event.get('ContentHash') and result_cache.enabled():
+        # The chunk is already complete; a failed cache write only costs a later recompute.
+        try:
+            result_cache.store(bucket_info['bucket'], event['ContentHash'], record)
+        except Exception:
+            logger.exception('Storing chunk in the result cache failed')
 
     return {"response": "success"}
 
@@ -0,0 +1,114 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+import os
+import sys
+import threading
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "source", "shared"))
+
+import clients  # noqa: E402
+
+
+def client_error(code, operation="Operation"):
+    from botocore.exceptions import ClientError
+
+    return ClientError({'Error': {'Code': code, 'Message': code}}, operation)
+
+
+class _Body:
+    def __init__(self, data):
+        self.data = data
+
+    def read(self):
+        return self.data
+
+
+class _Paginator:
+    def __init__(self, s3):
+        self.s3 = s3
+
+    def paginate(self, Bucket, Prefix):
+        yield self.s3.list_objects_v2(Bucket=Bucket, Prefix=Prefix)
+
+
+class FakeS3:
+    """
+    The S3 calls of the shared modules, on a dict of (bucket, key) -> bytes.
+    """
+
+    def __init__(self):
+        self.objects = {}
+        self.metadata = {}
+        self.uploads = {}
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def _get(self, bucket, key):
+        if (bucket, key) not in self.objects:
+            raise client_error('NoSuchKey')
+        return self.objects[(bucket, key)]
+
+    def head_object(self, Bucket, Key):
+        self.calls.append('head_object')
+        return {'ContentLength': len(self._get(Bucket, Key)), 'Metadata': self.metadata.get((Bucket, Key), {})}
+
+    def get_object(self, Bucket, Key, Range=None):
+        self.calls.append('get_object')
+        data = self._get(Bucket, Key)
+        if Range:
+            start, end = Range[len("bytes="):].split("-")
+            data = data[int(start):int(end) + 1]
+        return {'Body': _Body(data)}
+
+    def put_object(self, Bucket, Key, Body, **kwargs):
+        self.calls.append('put_object')
+        self.objects[(Bucket, Key)] = bytes(Body)
+        self.metadata[(Bucket, Key)] = kwargs.get('Metadata', {})
+
+    def upload_fileobj(self, fileobj, Bucket, Key, ExtraArgs=None):
+        self.put_object(Bucket, Key, fileobj.read(), **(ExtraArgs or {}))
+
+    def copy(self, CopySource, Bucket, Key, ExtraArgs=None):
+        self.put_object(Bucket, Key, self._get(CopySource['Bucket'], CopySource['Key']), **(ExtraArgs or {}))
+
+    def delete_object(self, Bucket, Key):
+        self.calls.append('delete_object')
+        self.objects.pop((Bucket, Key), None)
+
+    def create_multipart_upload(self, Bucket, Key, **kwargs):
+        self.calls.append('create_multipart_upload')
+        upload_id = "upload-%d" % len(self.calls)
+        self.uploads[upload_id] = {}
+        return {'UploadId': upload_id}
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body):
+        with self._lock:
+            self.calls.append('upload_part')
+            self.uploads[UploadId][PartNumber] = Body
+        return {'ETag': str(PartNumber)}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload):
+        self.calls.append('complete_multipart_upload')
+        parts = self.uploads.pop(UploadId)
+        self.objects[(Bucket, Key)] = b"".join(parts[part['PartNumber']] for part in MultipartUpload['Parts'])
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId):
+        self.calls.append('abort_multipart_upload')
+        self.uploads.pop(UploadId, None)
+
+    def list_objects_v2(self, Bucket, Prefix, **kwargs):
+        return {'Contents': [{'Key': key} for bucket, key in sorted(self.objects)
+                             if bucket == Bucket and key.startswith(Prefix)]}
+
+    def get_paginator(self, name):
+        return _Paginator(self)
+
+
+@pytest.fixture
+def s3(monkeypatch):
+    fake = FakeS3()
+    monkeypatch.setattr(clients, 'client', lambda service_name, *args, **kwargs: fake)
+    return fake
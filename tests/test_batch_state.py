@@ -0,0 +1,85 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+import threading
+from collections import Counter
+
+import batch_state
+
+
+class FakeTable:
+    """
+    Answers index queries on `items`, `page_size` items per page, for the equality and
+    greater-or-equal key conditions the status queries use.
+    """
+
+    def __init__(self, items, page_size=2):
+        self.items = items
+        self.page_size = page_size
+        self.queries = Counter()
+        self._lock = threading.Lock()
+
+    def _matches(self, item, condition):
+        expression = condition.get_expression()
+        if expression['operator'] == 'AND':
+            return all(self._matches(item, value) for value in expression['values'])
+        key, value = expression['values']
+        if expression['operator'] == '=':
+            return item.get(key.name) == value
+        if expression['operator'] == '>=':
+            return item.get(key.name, '') >= value
+        raise NotImplementedError(expression['operator'])
+
+    def query(self, IndexName, KeyConditionExpression, ExclusiveStartKey=None):
+        assert IndexName == batch_state.STATUS_INDEX
+        matches = [item for item in self.items if self._matches(item, KeyConditionExpression)]
+        start = ExclusiveStartKey['position'] if ExclusiveStartKey else 0
+        with self._lock:
+            self.queries[matches[0][batch_state.STATUS_SHARD_ATTRIBUTE] if matches else None] += 1
+        response = {'Items': matches[start:start + self.page_size]}
+        if start + self.page_size < len(matches):
+            response['LastEvaluatedKey'] = {'position': start + self.page_size}
+        return response
+
+
+def item(file_name, status, time):
+    return dict(batch_state.status_attributes(status, file_name), fileName=file_name,
+                **{batch_state.STATUS_TIME_ATTRIBUTE: time})
+
+
+def test_shard_of_a_file_is_stable_and_in_range():
+    shards = {batch_state.shard_key('INITIALIZED', "file%d.csv" % i, shards=10) for i in range(1000)}
+
+    assert shards == {"INITIALIZED#%d" % shard for shard in range(10)}
+    assert batch_state.shard_key('INITIALIZED', "a.csv", 10) == batch_state.shard_key('INITIALIZED', "a.csv", 10)
+    assert batch_state.shard_key('PROCESSED', "a.csv", 10).startswith("PROCESSED#")
+
+
+def test_files_are_spread_over_the_shards(monkeypatch):
+    monkeypatch.setenv('STATUS_SHARDS', '8')
+    counts = Counter(batch_state.status_attributes('INITIALIZED', "file%d.csv" % i)[batch_state.STATUS_SHARD_ATTRIBUTE]
+                     for i in range(8000))
+
+    assert len(counts) == 8
+    assert max(counts.values()) < 1.2 * min(counts.values())
+
+
+def test_query_status_reads_every_shard_oldest_first(monkeypatch):
+    monkeypatch.setenv('STATUS_SHARDS', '4')
+    items = [item("file%d.csv" % i, 'INITIALIZED', "2026-01-01T00:00:%02d+00:00" % (59 - i)) for i in range(20)]
+    items.append(item("done.csv", 'PROCESSED', "2026-01-01T00:00:00+00:00"))
+    table = FakeTable(items)
+
+    result = batch_state.query_status(table, 'INITIALIZED')
+
+    assert [found['fileName'] for found in result] == ["file%d.csv" % i for i in reversed(range(20))]
+    assert set(table.queries) <= {"INITIALIZED#%d" % shard for shard in range(4)} | {None}
+
+
+def test_query_status_since(monkeypatch):
+    monkeypatch.setenv('STATUS_SHARDS', '4')
+    table = FakeTable([item("old.csv", 'INITIALIZED', "2026-01-01T00:00:00+00:00"),
+                       item("new.csv", 'INITIALIZED', "2026-01-02T00:00:00+00:00")])
+
+    result = batch_state.query_status(table, 'INITIALIZED', since="2026-01-01T12:00:00+00:00")
+
+    assert [found['fileName'] for found in result] == ["new.csv"]
@@ -0,0 +1,100 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+import json
+from datetime import datetime, timedelta, timezone
+
+import checkpoint
+
+BUCKET = 'bucket'
+FOLDER = 'file-id'
+
+
+def part(index, count=3):
+    return "%s/to_process/testfile__part%d__of%d.csv" % (FOLDER, index, count)
+
+
+def split(s3, count=3):
+    parts = [part(index, count) for index in range(1, count + 1)]
+    for key in parts:
+        s3.put_object(Bucket=BUCKET, Key=key, Body=b"rows")
+    checkpoint.write_split_manifest(BUCKET, FOLDER, {"key": "testfile.csv", "parts": parts})
+    return parts
+
+
+def complete(s3, part_key, write_output=True):
+    output = checkpoint.output_key(part_key)
+    if write_output:
+        s3.put_object(Bucket=BUCKET, Key=output, Body=b"enriched rows")
+    checkpoint.mark_chunk_complete(BUCKET, FOLDER, checkpoint.chunk_index(part_key), {"output": output, "rows": 1})
+
+
+def age(s3, key, field, days):
+    document = json.loads(s3.objects[(BUCKET, key)])
+    document[field] = (datetime.now(timezone.utc) - timedelta(days=days)).isoformat()
+    s3.objects[(BUCKET, key)] = json.dumps(document).encode('utf-8')
+
+
+def test_resume_skips_completed_chunks(s3):
+    parts = split(s3)
+    complete(s3, parts[0])
+    complete(s3, parts[2])
+
+    manifest, completed = checkpoint.resume_state(BUCKET, FOLDER)
+
+    assert manifest['parts'] == parts
+    assert sorted(completed) == [1, 3]
+    assert checkpoint.pending_parts(parts, completed) == [parts[1]]
+
+
+def test_record_before_its_replicated_output_is_not_complete(s3):
+    parts = split(s3)
+    complete(s3, parts[0], write_output=False)
+
+    assert checkpoint.resume_state(BUCKET, FOLDER)[1] == {}
+
+
+def test_records_of_an_earlier_split_are_ignored(s3):
+    for old_part in [part(index, 5) for index in range(1, 6)]:
+        complete(s3, old_part)
+    parts = split(s3)
+    complete(s3, parts[1])
+
+    completed = checkpoint.resume_state(BUCKET, FOLDER)[1]
+
+    assert sorted(completed) == [2]
+    assert completed[2]['output'] == checkpoint.output_key(parts[1])
+
+
+def test_manifest_with_missing_parts_is_split_again(s3):
+    parts = split(s3)
+    s3.delete_object(Bucket=BUCKET, Key=parts[1])
+
+    assert checkpoint.resume_state(BUCKET, FOLDER) == (None, {})
+
+
+def test_manifest_of_another_reference_version_is_split_again(s3, monkeypatch):
+    split(s3)
+    monkeypatch.setenv('REFERENCE_DATA_VERSION', '2')
+
+    assert checkpoint.resume_state(BUCKET, FOLDER) == (None, {})
+
+
+def test_expired_manifest_is_split_again(s3, monkeypatch):
+    split(s3)
+    monkeypatch.setenv('CHECKPOINT_TTL_DAYS', '7')
+    age(s3, FOLDER + "/to_process/" + checkpoint.SPLIT_MANIFEST, 'splitAt', 8)
+
+    assert checkpoint.resume_state(BUCKET, FOLDER) == (None, {})
+
+
+def test_stale_records_are_processed_again(s3, monkeypatch):
+    parts = split(s3)
+    complete(s3, parts[0])
+    complete(s3, parts[1])
+    age(s3, "%s/%s/1.json" % (FOLDER, checkpoint.CHECKPOINT_FOLDER), 'completedAt', 8)
+    monkeypatch.setenv('CHECKPOINT_TTL_DAYS', '7')
+
+    assert sorted(checkpoint.completed_chunks(BUCKET, FOLDER, parts)) == [2]
+
+    monkeypatch.setenv('REFERENCE_DATA_VERSION', '2')
+    assert checkpoint.completed_chunks(BUCKET, FOLDER, parts) == {}
@@ -0,0 +1,134 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+import asyncio
+import threading
+
+import pytest
+
+import enrichment
+
+
+class FakeFetcher:
+    """
+    Knows every key except the ones in `missing`, and hands back each batch as
+    unprocessed the first `throttled_attempts` times it is asked for it.
+    """
+
+    def __init__(self, batch_size=1, missing=(), throttled_attempts=0):
+        self.batch_size = batch_size
+        self.missing = set(missing)
+        self.throttled_attempts = throttled_attempts
+        self.attempts = {}
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+
+    def fetch(self, keys):
+        with self._lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            attempt = self.attempts[tuple(keys)] = self.attempts.get(tuple(keys), 0) + 1
+        try:
+            if attempt <= self.throttled_attempts:
+                return {}, list(keys), 0
+            return {key: {"uuid": key, "Sales": key.upper()} for key in keys if key not in self.missing}, [], len(keys)
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+
+class RecordingRandom:
+    def __init__(self):
+        self.ceilings = []
+
+    def uniform(self, low, high):
+        self.ceilings.append(high)
+        return 0
+
+
+def rows(count):
+    return [{"uuid": "key-%d" % i, "Region": "Europe"} for i in range(count)]
+
+
+def test_rows_come_back_in_input_order():
+    input_rows = rows(250) + [{"uuid": "key-3", "Region": "Asia"}]
+    fetcher = FakeFetcher(batch_size=7, missing={"key-5"})
+
+    results = enrichment.EnrichmentEngine(fetcher, concurrency=4, max_concurrency=8).run(input_rows)
+
+    assert [row['uuid'] for row in results] == [row['uuid'] for row in input_rows]
+    assert results[-1]['Region'] == "Asia"
+    assert results[-1]['financialdata'] == {"item": {"uuid": "key-3", "Sales": "KEY-3"}}
+    assert results[5]['error-info']['Error'] == "ItemNotFound"
+    assert all('financialdata' in row for index, row in enumerate(results) if index != 5)
+
+
+def test_invalid_rows_are_not_looked_up():
+    def validate(row):
+        if row['uuid'] == "key-1":
+            raise ValueError("bad uuid")
+
+    fetcher = FakeFetcher()
+    engine = enrichment.EnrichmentEngine(fetcher, validate=validate, concurrency=2, max_concurrency=2)
+    results = engine.run(rows(3))
+
+    assert results[1]['error-info'] == {"Error": "ValueError", "Cause": "bad uuid"}
+    assert ("key-1",) not in fetcher.attempts
+    assert engine.stats['invalid'] == 1
+
+
+def test_throttled_keys_are_retried_with_growing_backoff(monkeypatch):
+    recording = RecordingRandom()
+    monkeypatch.setattr(enrichment, 'random', recording)
+    fetcher = FakeFetcher(batch_size=10, throttled_attempts=2)
+    engine = enrichment.EnrichmentEngine(fetcher, concurrency=1, max_concurrency=1, max_attempts=3)
+
+    results = engine.run(rows(10))
+
+    assert all('financialdata' in row for row in results)
+    assert engine.stats['throttles'] == 2
+    assert engine.stats['requests'] == 3
+    assert recording.ceilings == [enrichment._BASE_BACKOFF * 2, enrichment._BASE_BACKOFF * 4]
+
+
+def test_keys_that_stay_throttled_fail_the_chunk(monkeypatch):
+    monkeypatch.setattr(enrichment, 'random', RecordingRandom())
+    fetcher = FakeFetcher(batch_size=10, throttled_attempts=5)
+
+    with pytest.raises(enrichment.Throttled):
+        enrichment.EnrichmentEngine(fetcher, max_attempts=3).run(rows(10))
+
+
+def test_throttles_halve_the_limit():
+    async def throttle():
+        limiter = enrichment.AdaptiveLimiter(16, 32)
+        for _ in range(16):
+            await limiter.acquire()
+        for _ in range(16):
+            await limiter.release(throttled=True)
+        return limiter.limit
+
+    # The throttles of requests that were in flight together only halve the limit once.
+    assert asyncio.run(throttle()) == 8
+
+
+def test_waiting_is_bounded_by_the_worker_pool(monkeypatch):
+    waiting = {"now": 0, "max": 0}
+    acquire = enrichment.AdaptiveLimiter.acquire
+
+    async def counting_acquire(self):
+        waiting["now"] += 1
+        waiting["max"] = max(waiting["max"], waiting["now"])
+        try:
+            await acquire(self)
+        finally:
+            waiting["now"] -= 1
+
+    monkeypatch.setattr(enrichment.AdaptiveLimiter, 'acquire', counting_acquire)
+    fetcher = FakeFetcher()
+
+    results = enrichment.EnrichmentEngine(fetcher, concurrency=4, max_concurrency=8).run(rows(4000))
+
+    assert len(results) == 4000
+    assert waiting["max"] <= 8
+    assert fetcher.max_in_flight <= 8
@@ -0,0 +1,66 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+import pytest
+
+import existence_index
+
+BUCKET = 'bucket'
+
+
+@pytest.fixture
+def index_env(s3, monkeypatch):
+    monkeypatch.setenv('EXISTENCE_INDEX', 'on')
+    monkeypatch.setenv('SNAPSHOT_BUCKET', BUCKET)
+    monkeypatch.setattr(existence_index._current, '_loaded', None)
+    return s3
+
+
+def keys(prefix, count):
+    return ["%s-%d" % (prefix, i) for i in range(count)]
+
+
+@pytest.mark.parametrize("rate", [0.01, 0.001])
+def test_false_positive_rate_is_close_to_the_target(rate):
+    index = existence_index.BloomFilter.from_keys(keys("present", 20000), false_positive_rate=rate)
+
+    assert all(key in index for key in keys("present", 20000))
+    false_positives = sum(key in index for key in keys("absent", 100000)) / 100000
+    assert false_positives < rate * 1.5
+    assert index.expected_false_positive_rate() == pytest.approx(rate, rel=0.2)
+
+
+def test_filter_survives_serialization():
+    index = existence_index.BloomFilter.from_keys(keys("present", 1000))
+    restored = existence_index.BloomFilter.from_bytes(index.to_bytes())
+
+    assert (restored.bits, restored.hashes, restored.count) == (index.bits, index.hashes, 1000)
+    assert all(key in restored for key in keys("present", 1000))
+
+
+def test_other_bytes_are_rejected():
+    with pytest.raises(ValueError):
+        existence_index.BloomFilter.from_bytes(b"NOPE" + bytes(64))
+
+
+def test_current_index_is_the_latest_written(index_env):
+    existence_index.write_index(BUCKET, keys("present", 100))
+
+    index = existence_index.current_index()
+
+    assert index is not None
+    assert "present-7" in index
+
+
+def test_index_of_another_reference_version_is_not_used(index_env, monkeypatch):
+    existence_index.write_index(BUCKET, keys("present", 100), reference_version='1')
+    monkeypatch.setenv('REFERENCE_DATA_VERSION', '2')
+
+    assert existence_index.current_index() is None
+
+
+def test_no_index_when_turned_off_or_missing(index_env, monkeypatch):
+    assert existence_index.current_index() is None
+
+    existence_index.write_index(BUCKET, keys("present", 100))
+    monkeypatch.setenv('EXISTENCE_INDEX', 'off')
+    assert existence_index.current_index() is None
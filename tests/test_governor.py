@@ -0,0 +1,114 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+import pytest
+
+import governor
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(governor, 'time', clock)
+    return clock
+
+
+def fill(gov, file_id, count, weight=1):
+    return [gov.acquire("%s-%d" % (file_id, index), file_id, weight)[0] for index in range(count)]
+
+
+def test_file_alone_takes_every_slot(clock):
+    gov = governor.MemoryGovernor(limit=4, lease_seconds=60, waiter_seconds=30)
+
+    assert fill(gov, 'a', 5) == [True, True, True, True, False]
+
+
+def test_waiting_file_gets_its_share_before_the_holder_takes_more(clock):
+    gov = governor.MemoryGovernor(limit=4, lease_seconds=60, waiter_seconds=30)
+    fill(gov, 'a', 4)
+    assert not gov.acquire('b-0', 'b')[0]
+
+    gov.release('a-0')
+    # a holds 3 of 4 slots and b, which waits, holds none of its 2.
+    assert not gov.acquire('a-4', 'a')[0]
+    assert gov.acquire('b-0', 'b')[0]
+    gov.release('a-1')
+    assert gov.acquire('b-1', 'b')[0]
+    # Both are at their share now, so the next free slot goes to whoever asks.
+    gov.release('a-2')
+    assert gov.acquire('a-5', 'a')[0]
+
+
+def test_shares_follow_the_weights():
+    state = {'leases': {"a-%d" % i: {'file': 'a', 'weight': 3, 'expiresAt': 2000} for i in range(7)},
+             'waiting': {'b-0': {'file': 'b', 'weight': 1, 'seenAt': 1000}}}
+
+    # a's share of 10 slots is 7 and b's is 2, so a may not take an eighth while b waits.
+    assert not governor.plan(state, 'a-7', 'a', 3, 10, 1000, 30)[0]
+    assert governor.plan(state, 'b-0', 'b', 1, 10, 1000, 30)[0]
+    state['leases']['a-6']['expiresAt'] = 900
+    assert governor.plan(state, 'a-7', 'a', 3, 10, 1000, 30)[0]
+
+
+def test_expired_leases_free_their_slots(clock):
+    gov = governor.MemoryGovernor(limit=2, lease_seconds=60, waiter_seconds=30)
+    fill(gov, 'a', 2)
+    assert not gov.acquire('b-0', 'b')[0]
+
+    clock.now += 61
+
+    granted, usage = gov.acquire('b-0', 'b')
+    assert granted
+    assert usage == {'inFlight': 1, 'queueDepth': 0}
+    assert set(gov.state['leases']) == {'b-0'}
+
+
+def test_held_lease_is_granted_again(clock):
+    gov = governor.MemoryGovernor(limit=1, lease_seconds=60, waiter_seconds=30)
+
+    assert gov.acquire('a-0', 'a')[0]
+    assert gov.acquire('a-0', 'a')[0]
+
+
+def test_stale_waiters_no_longer_claim_a_share(clock):
+    gov = governor.MemoryGovernor(limit=2, lease_seconds=600, waiter_seconds=30)
+    fill(gov, 'a', 2)
+    assert not gov.acquire('b-0', 'b')[0]
+    gov.release('a-0')
+
+    clock.now += 31
+
+    assert gov.acquire('a-2', 'a')[0]
+    assert 'b-0' not in gov.state['waiting']
+
+
+def test_waiters_are_capped(clock):
+    gov = governor.MemoryGovernor(limit=1, lease_seconds=60, waiter_seconds=30, max_waiters=3)
+    fill(gov, 'a', 1)
+
+    for index in range(5):
+        gov.acquire("w-%d" % index, "w-%d" % index)
+
+    assert set(gov.state['waiting']) == {'w-0', 'w-1', 'w-2'}
+    # A registered waiter still refreshes its entry.
+    clock.now += 10
+    gov.acquire('w-0', 'w-0')
+    assert gov.state['waiting']['w-0']['seenAt'] == clock.now
+
+
+def test_lookup_share_splits_the_lookup_limit(monkeypatch):
+    monkeypatch.setenv('GOVERNOR_CHUNK_LIMIT', '20')
+    monkeypatch.delenv('GOVERNOR_LOOKUP_LIMIT', raising=False)
+    assert governor.lookup_share(32) == 32
+
+    monkeypatch.setenv('GOVERNOR_LOOKUP_LIMIT', '200')
+    assert governor.lookup_share(32) == 10
+    monkeypatch.setenv('GOVERNOR_LOOKUP_LIMIT', '10')
+    assert governor.lookup_share(32) == 1
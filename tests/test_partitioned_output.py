@@ -0,0 +1,31 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+import csv
+import io
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "source", "shared"))
+
+import partitioned_output  # noqa: E402
+
+
+def test_index_of_test_file_has_order_dates():
+    with open(os.path.join(ROOT, "assets", "testfile.csv"), newline='') as test_file:
+        reader = csv.reader(test_file)
+        header = next(reader)
+        writer = partitioned_output.PartitionedWriter(header, ["Region"])
+        for row in reader:
+            writer.writerow(row)
+
+    out_file = io.BytesIO()
+    index = writer.close(out_file)
+
+    assert index['partitions']
+    for partition in index['partitions']:
+        assert partition['minOrderDate'] is not None
+        assert partition['maxOrderDate'] is not None
+        assert partition['minOrderDate'] <= partition['maxOrderDate']
+        body = out_file.getvalue()[partition['offset']:partition['offset'] + partition['length']].decode('utf-8')
+        assert len(body.splitlines()) == partition['rows']
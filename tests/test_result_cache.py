@@ -0,0 +1,81 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+import json
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import checkpoint
+import result_cache
+
+BUCKET = 'bucket'
+CONTENT_HASH = "content-hash"
+
+
+def store(s3, errors=0):
+    s3.put_object(Bucket=BUCKET, Key="first/output/testfile__part1__of2.csv", Body=b"enriched rows")
+    record = {"output": "first/output/testfile__part1__of2.csv", "rows": 2, "sha256": "digest", "errors": errors}
+    if errors:
+        record['errorFile'] = "first/errors/testfile__part1__of2.csv"
+        s3.put_object(Bucket=BUCKET, Key=record['errorFile'], Body=b"rejected rows")
+    result_cache.store(BUCKET, CONTENT_HASH, record)
+
+
+def test_restore_copies_the_output_and_marks_the_chunk_complete(s3):
+    store(s3, errors=1)
+    part = "second/to_process/other__part2__of2.csv"
+
+    assert result_cache.restore(BUCKET, BUCKET + "/" + part, CONTENT_HASH)
+
+    assert s3.objects[(BUCKET, "second/output/other__part2__of2.csv")] == b"enriched rows"
+    assert s3.objects[(BUCKET, "second/errors/other__part2__of2.csv")] == b"rejected rows"
+    completed = checkpoint.completed_chunks(BUCKET, "second", [part])
+    assert completed[2]['cached']
+    assert completed[2]['rows'] == 2
+    assert completed[2]['errorFile'] == "second/errors/other__part2__of2.csv"
+
+
+def test_restore_without_errors_copies_no_error_file(s3):
+    store(s3)
+
+    assert result_cache.restore(BUCKET, BUCKET + "/second/to_process/other__part1__of1.csv", CONTENT_HASH)
+
+    assert (BUCKET, "second/errors/other__part1__of1.csv") not in s3.objects
+
+
+def test_miss_restores_nothing(s3):
+    assert not result_cache.restore(BUCKET, BUCKET + "/second/to_process/other__part1__of1.csv", CONTENT_HASH)
+    assert not [key for _, key in s3.objects if key.startswith("second/")]
+
+
+def test_entry_of_another_reference_version_is_a_miss(s3, monkeypatch):
+    store(s3)
+    monkeypatch.setenv('REFERENCE_DATA_VERSION', '2')
+
+    assert result_cache.lookup(BUCKET, CONTENT_HASH) is None
+
+
+def test_expired_entry_is_a_miss(s3, monkeypatch):
+    store(s3)
+    monkeypatch.setenv('RESULT_CACHE_TTL_DAYS', '30')
+    key = "/".join([result_cache.CACHE_PREFIX, result_cache.cache_key(CONTENT_HASH), result_cache.RESULT])
+    result = json.loads(s3.objects[(BUCKET, key)])
+    result['cachedAt'] = (datetime.now(timezone.utc) - timedelta(days=31)).isoformat()
+    s3.objects[(BUCKET, key)] = json.dumps(result).encode('utf-8')
+
+    assert result_cache.lookup(BUCKET, CONTENT_HASH) is None
+
+
+def test_partly_stored_entry_is_a_miss(s3, monkeypatch):
+    put_object = s3.put_object
+
+    def fail_result(Bucket, Key, Body, **kwargs):
+        if Key.endswith(result_cache.RESULT):
+            raise RuntimeError("put failed")
+        put_object(Bucket, Key, Body, **kwargs)
+
+    monkeypatch.setattr(s3, 'put_object', fail_result)
+    with pytest.raises(RuntimeError):
+        store(s3)
+
+    assert result_cache.lookup(BUCKET, CONTENT_HASH) is None
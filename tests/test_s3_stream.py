@@ -0,0 +1,74 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+import gc
+
+import pytest
+
+import s3_stream
+
+PART_SIZE = 5 * 1024 * 1024
+
+
+def test_small_object_is_written_with_one_put(s3):
+    with s3_stream.open_text_writer('bucket', 'small.csv') as out_file:
+        out_file.write("a,b\n")
+
+    assert s3.objects[('bucket', 'small.csv')] == b"a,b\n"
+    assert 'create_multipart_upload' not in s3.calls
+
+
+def test_large_object_is_uploaded_in_parts_and_read_back(s3):
+    body = "".join("%09d\n" % i for i in range(1200000))
+    with s3_stream.open_text_writer('bucket', 'large.csv', part_size=PART_SIZE) as out_file:
+        out_file.write(body)
+
+    assert s3.calls.count('upload_part') == 3
+    with s3_stream.open_text_reader('bucket', 'large.csv', part_size=PART_SIZE) as in_file:
+        assert in_file.read() == body
+
+
+def test_exception_in_with_block_aborts_the_upload(s3):
+    with pytest.raises(RuntimeError):
+        with s3_stream.open_text_writer('bucket', 'failed.csv', part_size=PART_SIZE) as out_file:
+            out_file.write("x" * (2 * PART_SIZE + 1))
+            raise RuntimeError("serialization failed")
+
+    assert ('bucket', 'failed.csv') not in s3.objects
+    assert 'abort_multipart_upload' in s3.calls
+    assert not s3.uploads
+
+
+def test_explicit_abort_publishes_nothing(s3):
+    out_file = s3_stream.open_text_writer('bucket', 'aborted.csv')
+    out_file.write("partial")
+    out_file.abort()
+    out_file.close()
+
+    assert ('bucket', 'aborted.csv') not in s3.objects
+    assert out_file.raw.failed
+
+
+def test_dropped_writers_are_not_published(s3):
+    out_file = s3_stream.open_text_writer('bucket', 'dropped.csv')
+    out_file.write("partial")
+    raw = s3_stream.MultipartWriter('bucket', 'dropped-raw.csv', s3_client=s3)
+    raw.write(b"partial")
+    del out_file, raw
+    gc.collect()
+
+    assert ('bucket', 'dropped.csv') not in s3.objects
+    assert ('bucket', 'dropped-raw.csv') not in s3.objects
+
+
+def test_failed_complete_aborts_the_upload(s3, monkeypatch):
+    def fail(**kwargs):
+        raise RuntimeError("complete failed")
+
+    monkeypatch.setattr(s3, 'complete_multipart_upload', fail)
+    out_file = s3_stream.open_text_writer('bucket', 'incomplete.csv', part_size=PART_SIZE)
+    out_file.write("x" * (PART_SIZE + 1))
+    with pytest.raises(RuntimeError):
+        out_file.close()
+
+    assert 'abort_multipart_upload' in s3.calls
+    assert ('bucket', 'incomplete.csv') not in s3.objects